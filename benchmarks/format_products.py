@@ -0,0 +1,87 @@
+"""Micro-benchmark of product formatting: per-row `format_product_data` against the bulk `format_product_frame`.
+
+Writes a synthetic products CSV shaped like an extract (100k rows by default),
+formats it per row, as a whole DataFrame and in streamed chunks, and checks
+that every way gives the same payloads.
+
+    python benchmarks/format_products.py [--rows 100000] [--chunk-size 1000]
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+import pandas as pd
+from upload import format_product_data, format_product_frame, iter_formatted_products
+
+FIELDNAMES = ['id', 'name', 'slug', 'type', 'status', 'sku', 'price', 'regular_price', 'sale_price',
+              'description', 'short_description', 'categories', 'tags', 'images', 'attributes', 'variants']
+
+
+def write_catalog(path, rows, seed=1):
+    """Write a synthetic products CSV, with category and tag reprs as an extract writes them."""
+    rng = random.Random(seed)
+    categories = [[{'id': i, 'name': f"Category {i}", 'slug': f"category-{i}"}] for i in range(1, 51)]
+    tags = [[{'id': 100 + i, 'name': f"Tag {i}", 'slug': f"tag-{i}"} for i in range(j, j + 3)] for j in range(20)]
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=FIELDNAMES, lineterminator='\n')
+        writer.writeheader()
+        for i in range(1, rows + 1):
+            price = f"{rng.randint(1, 500)}.{rng.randint(0, 99):02d}"
+            writer.writerow({
+                'id': i, 'name': f"Product {i}", 'slug': f"product-{i}", 'type': 'simple', 'status': 'publish',
+                'sku': f"SKU-{i:07d}", 'price': price, 'regular_price': price,
+                'sale_price': '' if i % 3 else price,
+                'description': f"<p>Description of product {i}</p>", 'short_description': '',
+                'categories': repr(rng.choice(categories)), 'tags': repr(rng.choice(tags)) if i % 4 else '[]',
+                'images': '[]', 'attributes': '[]', 'variants': '[]',
+            })
+
+def timed(func):
+    """Return `(result, seconds)` of calling `func()`."""
+    started = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'products.csv')
+        write_catalog(path, args.rows)
+
+        def per_row():
+            with open(path, encoding='utf-8', newline='') as file:
+                return [format_product_data(row) for row in csv.DictReader(file)]
+
+        def bulk_frame():
+            frame = pd.read_csv(path, dtype=str, keep_default_na=False)
+            return format_product_frame(frame)
+
+        def bulk_chunks():
+            # The streaming path used by uploads and extracts
+            with open(path, encoding='utf-8', newline='') as file:
+                rows = csv.DictReader(file)
+                return [payload for _, payload in iter_formatted_products(rows, chunk_size=args.chunk_size)]
+
+        expected, baseline = timed(per_row)
+        print(f"{'format_product_data, per row':<44} {baseline:7.2f} s  {args.rows / baseline:10,.0f} rows/s")
+        for name, func in (("format_product_frame, whole file", bulk_frame),
+                           (f"iter_formatted_products, {args.chunk_size}-row chunks", bulk_chunks)):
+            payloads, seconds = timed(func)
+            if payloads != expected:
+                print(f"{name}: payloads differ from format_product_data")
+                return 1
+            print(f"{name:<44} {seconds:7.2f} s  {args.rows / seconds:10,.0f} rows/s  {baseline / seconds:5.1f}x")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""Load benchmark: extract, upload and restore against the local mock store.
+
+For each catalog size, starts the mock store from `benchmarks/mock_store.py`
+with a synthetic catalog, runs each step through `main.py` in a fresh process
+and reports its wall time, the requests the store served, the data sent and
+the peak RSS of the step's process. The steps run in order against the same
+store and data directory:
+
+- extract: `extract --full`, the whole catalog with variations
+- upload: `upload products --force`, every product sent back by SKU
+- restore: after 1% of the prices are changed in the store, `restore products
+  --to-store --changed-only` puts them back from the extract's backup
+
+Step output goes to `<workdir>/<size>/<step>.log`, and each step's metrics
+report goes to `<step>.metrics.json` next to it.
+
+    python benchmarks/load.py [--sizes 1k,50k,200k] [--steps extract,upload,restore] [--latency 0.02]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from mock_store import MockStore, start_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STEPS = {
+    'extract': ['extract', '--full'],
+    'upload': ['upload', 'products', '--force'],
+    'restore': ['restore', 'products', '--to-store', '--changed-only', '--yes', '--before', '9999-12-31T23:59:59'],
+}
+
+
+def parse_size(value):
+    """Parse a catalog size such as `1000`, `50k` or `1m`."""
+    value = value.strip().lower()
+    multiplier = {'k': 1_000, 'm': 1_000_000}.get(value[-1:], 1)
+    return int(float(value.rstrip('km')) * multiplier)
+
+def run_step(args, env, cwd, log_path):
+    """Run `main.py` with `args`. Returns `(exit code, wall seconds, peak RSS in MB)` of the process."""
+    started = time.perf_counter()
+    with open(log_path, 'w', encoding='utf-8') as log:
+        process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'main.py'), *args], cwd=cwd, env=env,
+                                   stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT)
+        # wait4 returns the resource usage of this process alone
+        _, status, usage = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - started
+    process.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    rss = usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    return process.returncode, seconds, rss
+
+def benchmark_size(products, steps, args, workdir):
+    """Run the steps against a fresh store of `products` products. Returns one result dict per step."""
+    started = time.perf_counter()
+    store = MockStore(products, latency=args.latency, jitter=args.jitter, throttle_every=args.throttle_every)
+    print(f"\n{products:,} products ({sum(len(v) for v in store.variations.values()):,} variations), "
+          f"generated in {time.perf_counter() - started:.1f}s")
+    server = start_server(store)
+    cwd = os.path.join(workdir, str(products))
+    os.makedirs(cwd, exist_ok=True)
+    env = {**os.environ, 'WOO_URL': server.url, 'CONSUMER_KEY': 'ck_benchmark', 'CONSUMER_SECRET': 'cs_benchmark',
+           'RATE_LIMIT': str(args.rate_limit), 'SNAPSHOT_FORMAT': args.format}
+    results = []
+    try:
+        for step in steps:
+            if step == 'restore':
+                store.touch(0.01)
+            with store.lock:
+                requests_before, bytes_before = sum(store.requests.values()), store.bytes_out
+            log_path = os.path.join(cwd, f"{step}.log")
+            command = ['--metrics-report', os.path.join(cwd, f"{step}.metrics.json"), *STEPS[step]]
+            code, seconds, rss = run_step(command, env, cwd, log_path)
+            with store.lock:
+                requests = sum(store.requests.values()) - requests_before
+                sent = store.bytes_out - bytes_before
+            result = {'products': products, 'step': step, 'ok': code == 0, 'seconds': seconds,
+                      'requests': requests, 'mb_sent': sent / 1024 / 1024, 'rss_mb': rss}
+            results.append(result)
+            print(f"  {step:<8} {seconds:8.2f} s  {products / seconds:9,.0f} products/s  {requests:7,} requests  "
+                  f"{result['mb_sent']:8.1f} MB served  {rss:7.1f} MB peak RSS  {'ok' if code == 0 else f'FAILED, see {log_path}'}")
+    finally:
+        server.shutdown()
+        server.server_close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1k,50k,200k', help="comma-separated catalog sizes (default 1k,50k,200k)")
+    parser.add_argument('--steps', default=','.join(STEPS), help="comma-separated steps to run, in order")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds the store sleeps before every response")
+    parser.add_argument('--jitter', type=float, default=0.0, help="up to this many extra seconds of latency, at random")
+    parser.add_argument('--throttle-every', type=int, default=0, help="answer every Nth request with HTTP 429")
+    parser.add_argument('--rate-limit', type=float, default=0,
+                        help="client RATE_LIMIT in requests/second (default 0, unlimited, to measure the pipeline itself)")
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv', help="snapshot format")
+    parser.add_argument('--workdir', help="directory for the data, logs and metrics of each run (default: a temporary one)")
+    args = parser.parse_args()
+
+    steps = [step.strip() for step in args.steps.split(',') if step.strip()]
+    unknown = [step for step in steps if step not in STEPS]
+    if unknown:
+        parser.error(f"unknown steps: {', '.join(unknown)}")
+    workdir = args.workdir or tempfile.mkdtemp(prefix='woocommerce-load-')
+    print(f"Working directory: {workdir}")
+
+    failed = False
+    for size in args.sizes.split(','):
+        results = benchmark_size(parse_size(size), steps, args, workdir)
+        failed = failed or not all(result['ok'] for result in results)
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,463 @@
+"""Local stand-in for the parts of the WooCommerce v3 REST API this project uses.
+
+Serves a synthetic catalog from memory. It covers paginated `products`,
+`products/<id>/variations`, `products/categories` and `products/tags`, their
+`batch` endpoints and single-item routes. Lists honour `page`, `per_page`,
+`orderby`, `order`, `include`, `sku`, `modified_after` and `_fields`, and send
+the `X-WP-Total` and `X-WP-TotalPages` headers. Latency and HTTP 429 responses
+can be injected. Authentication is not checked.
+
+    python benchmarks/mock_store.py [--products 1000] [--port 8080] [--latency 0.05] [--throttle-every 50]
+    WOO_URL=http://127.0.0.1:8080 CONSUMER_KEY=ck CONSUMER_SECRET=cs python main.py extract --full
+"""
+import argparse
+import gzip
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+TAXONOMIES = ('categories', 'tags')
+
+ROUTES = [
+    ('products', re.compile(r'^products$')),
+    ('products/batch', re.compile(r'^products/batch$')),
+    ('terms', re.compile(r'^products/(categories|tags)$')),
+    ('terms/batch', re.compile(r'^products/(categories|tags)/batch$')),
+    ('term', re.compile(r'^products/(categories|tags)/(\d+)$')),
+    ('product', re.compile(r'^products/(\d+)$')),
+    ('variations', re.compile(r'^products/(\d+)/variations$')),
+    ('variations/batch', re.compile(r'^products/(\d+)/variations/batch$')),
+    ('variation', re.compile(r'^products/(\d+)/variations/(\d+)$')),
+]
+
+
+class StoreError(Exception):
+    """An error response in the WooCommerce format: `{code, message, data: {status}}`."""
+
+    def __init__(self, status, code, message):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+
+    def body(self):
+        return {'code': self.code, 'message': str(self), 'data': {'status': self.status}}
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+
+def _slugify(name):
+    return re.sub(r'[^a-z0-9]+', '-', str(name).lower()).strip('-')
+
+
+class MockStore:
+    """An in-memory WooCommerce catalog with request counters and fault injection.
+
+    `latency` (plus up to `jitter`) seconds are slept before every response, and
+    every `throttle_every`-th request is answered with HTTP 429 and a
+    `Retry-After` of `retry_after` seconds. Batches of more than `batch_limit`
+    items are rejected with HTTP 413, as the server does.
+    """
+
+    def __init__(self, products=1000, categories=50, tags=100, variable_every=20, variations=3,
+                 latency=0.0, jitter=0.0, throttle_every=0, retry_after=1, batch_limit=100, seed=1):
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.batch_limit = batch_limit
+        self.lock = threading.RLock()
+        self.requests = Counter()
+        self.throttled = 0
+        self.bytes_out = 0
+        self.products = {}
+        self.variations = {}
+        self.skus = {}
+        self.terms = {taxonomy: {} for taxonomy in TAXONOMIES}
+        self.term_versions = Counter()
+        self.next_id = 1
+        self.next_term_id = 1
+        self.generate(products, categories, tags, variable_every, variations, seed)
+
+    def generate(self, products, categories, tags, variable_every, variations, seed):
+        """Fill the store with a deterministic synthetic catalog."""
+        rng = random.Random(seed)
+        created = '2024-01-01T00:00:00'
+        for taxonomy, count, label in (('categories', categories, 'Category'), ('tags', tags, 'Tag')):
+            for i in range(1, count + 1):
+                self.add_term(taxonomy, {'name': f"{label} {i}", 'description': ''})
+        category_ids = list(self.terms['categories'])
+        tag_ids = list(self.terms['tags'])
+        for i in range(1, products + 1):
+            variable = bool(variable_every) and i % variable_every == 0
+            price = f"{rng.randint(1, 500)}.{rng.randint(0, 99):02d}"
+            product = self.add_product({
+                'name': f"Product {i}", 'type': 'variable' if variable else 'simple', 'status': 'publish',
+                'sku': f"SKU-{i:07d}", 'regular_price': price, 'sale_price': '' if i % 3 else price,
+                'description': f"<p>Description of product {i}</p>", 'short_description': '',
+                'manage_stock': True, 'stock_quantity': rng.randint(0, 100),
+                'categories': [{'id': rng.choice(category_ids)}] if category_ids else [],
+                'tags': [{'id': tag_id} for tag_id in rng.sample(tag_ids, min(2, len(tag_ids)))],
+            }, created)
+            if variable:
+                for j in range(1, variations + 1):
+                    self.add_variation(product['id'], {
+                        'sku': f"SKU-{i:07d}-{j}", 'regular_price': price, 'sale_price': '',
+                        'manage_stock': True, 'stock_quantity': rng.randint(0, 50),
+                        'attributes': [{'id': 0, 'name': 'Size', 'option': f"Size {j}"}],
+                    }, created)
+
+    # Catalog
+
+    def _apply(self, item, data, modified):
+        sku = data.get('sku')
+        if sku is not None and sku != item.get('sku'):
+            if sku and self.skus.get(sku, item['id']) != item['id']:
+                raise StoreError(400, 'product_invalid_sku', "Invalid or duplicated SKU.")
+            self.skus.pop(item.get('sku'), None)
+            if sku:
+                self.skus[sku] = item['id']
+        for key, value in data.items():
+            if key == 'id':
+                continue
+            if key in TAXONOMIES:
+                value = [self._term_ref(key, term) for term in value or []]
+            elif key in ('regular_price', 'sale_price'):
+                value = '' if value is None else str(value)
+            elif key == 'stock_quantity' and value not in (None, ''):
+                value = int(float(value))
+            item[key] = value
+        item['price'] = item.get('sale_price') or item.get('regular_price') or ''
+        if item.get('manage_stock') and item.get('stock_quantity') is not None:
+            item['stock_status'] = 'instock' if item['stock_quantity'] > 0 else 'outofstock'
+        item['date_modified_gmt'] = modified or _now()
+        return item
+
+    def _term_ref(self, taxonomy, term):
+        if isinstance(term, dict):
+            if 'id' in term and int(term['id']) in self.terms[taxonomy]:
+                stored = self.terms[taxonomy][int(term['id'])]
+                return {'id': stored['id'], 'name': stored['name'], 'slug': stored['slug']}
+            if term.get('name'):
+                for stored in self.terms[taxonomy].values():
+                    if stored['name'] == term['name']:
+                        return {'id': stored['id'], 'name': stored['name'], 'slug': stored['slug']}
+        return term
+
+    def add_product(self, data, modified=None):
+        product = {'id': self.next_id, 'name': '', 'slug': '', 'type': 'simple', 'status': 'publish', 'sku': '',
+                   'price': '', 'regular_price': '', 'sale_price': '', 'description': '', 'short_description': '',
+                   'manage_stock': False, 'stock_quantity': None, 'stock_status': 'instock',
+                   'categories': [], 'tags': [], 'images': [], 'attributes': [], 'variations': [],
+                   'date_created_gmt': modified or _now()}
+        self.next_id += 1
+        self._apply(product, data, modified)
+        product['slug'] = product['slug'] or _slugify(product['name'])
+        self.products[product['id']] = product
+        return product
+
+    def add_variation(self, parent_id, data, modified=None):
+        variation = {'id': self.next_id, 'parent_id': parent_id, 'sku': '', 'price': '', 'regular_price': '',
+                     'sale_price': '', 'manage_stock': False, 'stock_quantity': None, 'stock_status': 'instock',
+                     'attributes': [], 'date_created_gmt': modified or _now()}
+        self.next_id += 1
+        self._apply(variation, data, modified)
+        self.variations.setdefault(parent_id, {})[variation['id']] = variation
+        self.products[parent_id]['variations'].append(variation['id'])
+        return variation
+
+    def add_term(self, taxonomy, data):
+        slug = data.get('slug') or _slugify(data.get('name', ''))
+        for stored in self.terms[taxonomy].values():
+            if stored['slug'] == slug:
+                raise StoreError(400, 'term_exists', "A term with the name provided already exists.")
+        term = {'id': self.next_term_id, 'name': data.get('name', ''), 'slug': slug,
+                'description': data.get('description', ''), 'parent': data.get('parent', 0), 'count': 0}
+        self.next_term_id += 1
+        self.terms[taxonomy][term['id']] = term
+        self.term_versions[taxonomy] += 1
+        return term
+
+    def touch(self, fraction=0.01, seed=2):
+        """Change the regular price of a fraction of the products, as edits made in the store would."""
+        rng = random.Random(seed)
+        with self.lock:
+            ids = list(self.products)
+            changed = rng.sample(ids, max(1, int(len(ids) * fraction))) if ids else []
+            for product_id in changed:
+                product = self.products[product_id]
+                self._apply(product, {'regular_price': f"{rng.randint(501, 999)}.00"}, None)
+        return len(changed)
+
+    # Request handling
+
+    def list_items(self, collection, query, default_orderby='date', default_order='desc'):
+        """Filter, sort, paginate and project an `{id: item}` collection as the REST list endpoints do.
+
+        Collections are kept in id order, which is also their creation order, so
+        lists ordered by id or date are not sorted again on every page.
+        """
+        per_page = int(query.get('per_page', 10))
+        page = int(query.get('page', 1))
+        if not 1 <= per_page <= 100:
+            raise StoreError(400, 'rest_invalid_param', "Invalid parameter(s): per_page")
+        if 'include' in query:
+            include = sorted({int(value) for value in query['include'].split(',') if value})
+            items = [collection[item_id] for item_id in include if item_id in collection]
+        else:
+            items = list(collection.values())
+        if 'sku' in query:
+            skus = set(query['sku'].split(','))
+            items = [item for item in items if item.get('sku') in skus]
+        if 'modified_after' in query:
+            after = query['modified_after'][:19]
+            items = [item for item in items if item.get('date_modified_gmt', '') > after]
+        sort_key = {'name': 'name', 'slug': 'slug'}.get(query.get('orderby', default_orderby))
+        descending = query.get('order', default_order) == 'desc'
+        if sort_key:
+            items.sort(key=lambda item: (item.get(sort_key), item['id']), reverse=descending)
+        elif descending:
+            items.reverse()
+        total = len(items)
+        total_pages = math.ceil(total / per_page)
+        if total and page > total_pages:
+            raise StoreError(400, 'rest_post_invalid_page_number',
+                             "The page number requested is larger than the number of pages available.")
+        items = items[(page - 1) * per_page:page * per_page]
+        if query.get('_fields'):
+            fields = query['_fields'].split(',')
+            items = [{field: item[field] for field in fields if field in item} for item in items]
+        return items, {'X-WP-Total': str(total), 'X-WP-TotalPages': str(total_pages)}
+
+    def batch(self, data, create, update, delete):
+        """Run a batch request; item errors are returned in place of the item, as the server does."""
+        if sum(len(data.get(action) or []) for action in ('create', 'update', 'delete')) > self.batch_limit:
+            raise StoreError(413, 'rest_request_entity_too_large',
+                             f"Unable to accept more than {self.batch_limit} items for this request.")
+        result = {}
+        for action, func in (('create', create), ('update', update), ('delete', delete)):
+            if action not in data:
+                continue
+            result[action] = []
+            for item in data[action] or []:
+                try:
+                    result[action].append(func(item))
+                except StoreError as e:
+                    item_id = item.get('id', 0) if isinstance(item, dict) else item
+                    result[action].append({'id': item_id, 'error': e.body()})
+        return result
+
+    def _product(self, product_id):
+        if product_id not in self.products:
+            raise StoreError(404, 'woocommerce_rest_product_invalid_id', "Invalid ID.")
+        return self.products[product_id]
+
+    def _variation(self, parent_id, variation_id):
+        variation = self.variations.get(parent_id, {}).get(variation_id)
+        if variation is None:
+            raise StoreError(404, 'woocommerce_rest_product_invalid_id', "Invalid ID.")
+        return variation
+
+    def _term(self, taxonomy, term_id):
+        if term_id not in self.terms[taxonomy]:
+            raise StoreError(404, 'woocommerce_rest_term_invalid', "Resource does not exist.")
+        return self.terms[taxonomy][term_id]
+
+    def create_product(self, data):
+        return self.add_product(data)
+
+    def update_product(self, data):
+        product = self._product(int(data.get('id', 0)))
+        return self._apply(product, data, None)
+
+    def delete_product(self, product_id):
+        product = self._product(int(product_id))
+        del self.products[product['id']]
+        for item in [product, *self.variations.pop(product['id'], {}).values()]:
+            self.skus.pop(item.get('sku'), None)
+        return product
+
+    def create_variation(self, parent_id, data):
+        self._product(parent_id)
+        return self.add_variation(parent_id, data)
+
+    def update_variation(self, parent_id, data):
+        variation = self._variation(parent_id, int(data.get('id', 0)))
+        return self._apply(variation, data, None)
+
+    def delete_variation(self, parent_id, variation_id):
+        variation = self._variation(parent_id, int(variation_id))
+        del self.variations[parent_id][variation['id']]
+        self.skus.pop(variation.get('sku'), None)
+        self.products[parent_id]['variations'].remove(variation['id'])
+        return variation
+
+    def update_term(self, taxonomy, data):
+        term = self._term(taxonomy, int(data.get('id', 0)))
+        term.update({key: value for key, value in data.items() if key in ('name', 'slug', 'description', 'parent')})
+        self.term_versions[taxonomy] += 1
+        return term
+
+    def delete_term(self, taxonomy, term_id):
+        term = self._term(taxonomy, int(term_id))
+        del self.terms[taxonomy][term['id']]
+        self.term_versions[taxonomy] += 1
+        return term
+
+    def handle(self, method, route, match, query, data):
+        """Answer one request. Returns `(status, headers, body)`."""
+        args = match.groups()
+        if route == 'products':
+            if method == 'POST':
+                return 201, {}, self.create_product(data)
+            items, headers = self.list_items(self.products, query)
+            return 200, headers, items
+        if route == 'products/batch':
+            return 200, {}, self.batch(data, self.create_product, self.update_product, self.delete_product)
+        if route == 'product':
+            product_id = int(args[0])
+            if method in ('PUT', 'POST'):
+                return 200, {}, self.update_product({**data, 'id': product_id})
+            if method == 'DELETE':
+                return 200, {}, self.delete_product(product_id)
+            return 200, {}, self._product(product_id)
+        if route in ('variations', 'variations/batch', 'variation'):
+            parent_id = int(args[0])
+            self._product(parent_id)
+            if route == 'variations/batch':
+                return 200, {}, self.batch(data, lambda item: self.create_variation(parent_id, item),
+                                           lambda item: self.update_variation(parent_id, item),
+                                           lambda item: self.delete_variation(parent_id, item))
+            if route == 'variations':
+                if method == 'POST':
+                    return 201, {}, self.create_variation(parent_id, data)
+                items, headers = self.list_items(self.variations.get(parent_id, {}), query)
+                return 200, headers, items
+            variation_id = int(args[1])
+            if method in ('PUT', 'POST'):
+                return 200, {}, self.update_variation(parent_id, {**data, 'id': variation_id})
+            if method == 'DELETE':
+                return 200, {}, self.delete_variation(parent_id, variation_id)
+            return 200, {}, self._variation(parent_id, variation_id)
+        taxonomy = args[0]
+        if route == 'terms':
+            if method == 'POST':
+                return 201, {}, self.add_term(taxonomy, data)
+            items, headers = self.list_items(self.terms[taxonomy], query, 'name', 'asc')
+            headers['ETag'] = f'"{taxonomy}-{self.term_versions[taxonomy]}"'
+            return 200, headers, items
+        if route == 'terms/batch':
+            return 200, {}, self.batch(data, lambda item: self.add_term(taxonomy, item),
+                                       lambda item: self.update_term(taxonomy, item),
+                                       lambda item: self.delete_term(taxonomy, item))
+        term_id = int(args[1])
+        if method in ('PUT', 'POST'):
+            return 200, {}, self.update_term(taxonomy, {**data, 'id': term_id})
+        if method == 'DELETE':
+            return 200, {}, self.delete_term(taxonomy, term_id)
+        return 200, {}, self._term(taxonomy, term_id)
+
+    def respond(self, method, url, body):
+        """Route a request, applying the injected latency and throttling. Returns `(status, headers, body)`.
+
+        The response body is encoded while the store is locked, so it never sees a half-applied write.
+        """
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+        parts = urlsplit(url)
+        path = re.sub(r'^.*?/wp-json/wc/v\d+/', '', parts.path).strip('/')
+        # The woocommerce client sends its params both in the URL and as `params`, so keep the first value
+        query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+        for route, pattern in ROUTES:
+            match = pattern.match(path)
+            if match:
+                break
+        else:
+            route, match = None, None
+        with self.lock:
+            self.requests[f"{method} {route or path}"] += 1
+            if self.throttle_every and sum(self.requests.values()) % self.throttle_every == 0:
+                self.throttled += 1
+                status, headers, payload = 429, {'Retry-After': str(self.retry_after)}, StoreError(
+                    429, 'woocommerce_rest_too_many_requests', "Too many requests.").body()
+            elif match is None:
+                status, headers, payload = 404, {}, StoreError(
+                    404, 'rest_no_route', "No route was found matching the URL and request method.").body()
+            else:
+                try:
+                    status, headers, payload = self.handle(method, route, match, query, json.loads(body) if body else {})
+                except StoreError as e:
+                    status, headers, payload = e.status, {}, e.body()
+                except (ValueError, KeyError, TypeError) as e:
+                    status, headers, payload = 400, {}, StoreError(400, 'rest_invalid_param', str(e)).body()
+            return status, headers, json.dumps(payload).encode('utf-8')
+
+
+class MockStoreHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; without this, delayed ACKs add ~40 ms to every response
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _dispatch(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        status, headers, content = self.server.store.respond(self.command, self.path, body)
+        if 'gzip' in self.headers.get('Accept-Encoding', '') and len(content) > 1024:
+            content = gzip.compress(content, compresslevel=5)
+            headers['Content-Encoding'] = 'gzip'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(content)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+        with self.server.store.lock:
+            self.server.store.bytes_out += len(content)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _dispatch
+
+
+def start_server(store, host='127.0.0.1', port=0):
+    """Serve `store` from a background thread. Returns the server; its URL is `server.url`."""
+    server = ThreadingHTTPServer((host, port), MockStoreHandler)
+    server.daemon_threads = True
+    server.store = store
+    server.url = f"http://{host}:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds slept before every response")
+    parser.add_argument('--jitter', type=float, default=0.0, help="up to this many extra seconds, at random")
+    parser.add_argument('--throttle-every', type=int, default=0, help="answer every Nth request with HTTP 429")
+    args = parser.parse_args()
+
+    store = MockStore(args.products, latency=args.latency, jitter=args.jitter, throttle_every=args.throttle_every)
+    server = start_server(store, args.host, args.port)
+    print(f"Mock store with {len(store.products)} products listening on {server.url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(f"Served {sum(store.requests.values())} requests")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
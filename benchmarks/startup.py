@@ -0,0 +1,68 @@
+"""Startup-time budget for the CLI entry points.
+
+Measures how long `main.py` takes to print its help and its menu, and checks
+that pandas, woocommerce, requests and pyarrow are not imported before a step
+actually needs them. Exits with status 1 when a check fails.
+
+    python benchmarks/startup.py [--runs 5] [--budget 0.3]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ['pandas', 'woocommerce', 'requests', 'pyarrow']
+
+# Imports every step module, as the steps themselves do, and lists the heavy modules that were loaded
+IMPORT_CHECK = f"""
+import sys
+sys.path.insert(0, {os.path.join(ROOT, 'src')!r})
+import backup, backup_store, client, diff, extract, inventory, jobs, metrics, restore, snapshot, stores, terms, upload, utils
+print(','.join(name for name in {HEAVY_MODULES!r} if name in sys.modules))
+"""
+
+
+def time_command(args, stdin=None, runs=5):
+    """Return the median wall time of running a Python command, in seconds."""
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, *args], input=stdin, cwd=ROOT, check=True, text=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=float(os.getenv('STARTUP_BUDGET', 0.3)),
+                        help="maximum median seconds until the help or the menu is printed (default 0.3)")
+    args = parser.parse_args()
+
+    baseline = time_command(['-c', 'pass'], runs=args.runs)
+    results = {
+        'main.py --help': time_command(['main.py', '--help'], runs=args.runs),
+        # Open the menu and choose "Exit the program" right away
+        'main.py (menu)': time_command(['main.py'], stdin='6\n', runs=args.runs),
+    }
+    failed = False
+    print(f"{'interpreter':<16} {baseline * 1000:8.1f} ms")
+    for name, seconds in results.items():
+        ok = seconds <= args.budget
+        failed = failed or not ok
+        print(f"{name:<16} {seconds * 1000:8.1f} ms  {'ok' if ok else f'over the {args.budget * 1000:.0f} ms budget'}")
+
+    loaded = subprocess.run([sys.executable, '-c', IMPORT_CHECK], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout.strip()
+    if loaded:
+        failed = True
+        print(f"Heavy modules imported by the step modules at import time: {loaded}")
+    else:
+        print(f"None of {', '.join(HEAVY_MODULES)} is imported until a step needs it")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
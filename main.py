@@ -1,51 +1,190 @@
-import subprocess
+import argparse
 import logging
+import os
 import sys
-from src.utils import fetch_categories, fetch_tags
+
+# The modules in src/ import each other as top-level modules, as they do when run as scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+# The modules that run each step are imported inside the functions below, so the menu and
+# --help come up without loading the HTTP client, and only the step that runs pays for its imports
+from config import (EXTRACT_PROFILES, METRICS_REPORT, PRODUCTS_FILE, STORE_PARALLELISM, GLOBAL_CONCURRENCY,
+                    STORES_FILE, INVENTORY_FILE)
 
 # Logging configuration
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def fetch_products():
-    """This function fetches product data."""
-    logging.info("Fetching product data...")
-    try:
-        subprocess.run(["python", "src/extract.py"], check=True)
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Error running extract.py: {e}")
-    except Exception as e:
-        logging.error(f"Unexpected error: {e}")
+KINDS = ['products', 'categories', 'tags']
 
-def upload_data(option):
-    """This function uploads data to the website."""
-    logging.info(f"Uploading {option} to the website...")
-    try:
-        subprocess.run(["python", f"src/upload.py", option], check=True)
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Error running upload.py 3 with option {option}: {e}")
-        sys.exit(1)
-    except Exception as e:
-        logging.error(f"Unexpected error: {e}")
+# Options that choose the stores a command fans out to; they are not passed on to each store's run
+FAN_OUT_OPTIONS = ('--stores', '--parallel', '--budget')
+
+
+def run_extract(kind='products', full=False, filename=None, profile='full', restart=False):
+    """Extract products, categories or tags from the store into data/. Returns True on success."""
+    if kind == 'products':
+        from extract import extract_products
+        return extract_products(full=full, filename=filename, profile=profile, restart=restart)
+    from utils import fetch_categories, fetch_tags
+    return fetch_categories() if kind == 'categories' else fetch_tags()
+
+def run_upload(kind, force=False, filename=PRODUCTS_FILE, restart=False, shared=False):
+    """Upload products, categories or tags from data/ to the store. Returns True when every row was uploaded."""
+    from upload import upload_categories, upload_products, upload_tags
+    if kind == 'products':
+        summary = upload_products(filename, force=force, restart=restart, shared=shared)
+    elif kind == 'categories':
+        summary = upload_categories(restart=restart)
+    else:
+        summary = upload_tags(restart=restart)
+    return summary is not None and not summary['failed']
+
+def run_restore(kind, backup_name=None, before=None, to_store=False, ids=None, skus=None,
+                changed_only=False, assume_yes=False):
+    """Restore a backup to data/, or to the store with `to_store`. Returns True on success.
+
+    The backup is `backup_name`, else the latest one taken at or before `before`,
+    else the one the user picks from the list.
+    """
+    import backup
+    import restore
+    from backup_store import snapshot_before
+    if backup_name is None and before:
+        backup_name = snapshot_before(kind, before)
+        if backup_name is None:
+            logging.error(f"No {kind} backup found at or before {before}")
+            return False
+    if not to_store:
+        return restore.restore_backup(kind, backup_name)
+    backup_name = backup_name or backup.choose_backup(backup.list_backups(kind))
+    if backup_name is None:
+        logging.info("No backup file chosen.")
+        return False
+    summary = backup.restore_to_store(kind, backup_name, ids, skus, changed_only, assume_yes)
+    return summary is None or not summary['failed']
+
+def run_sync(force=False, filename=PRODUCTS_FILE, restart=False, shared=False):
+    """Upload categories, tags and products, in that order so products can use new terms. Stops at the first failure."""
+    for kind in KINDS[1:]:
+        if not os.path.exists(f"data/{kind}.csv"):
+            logging.info(f"Skipping {kind}: data/{kind}.csv does not exist")
+        elif not run_upload(kind, restart=restart):
+            logging.error(f"Sync stopped: uploading {kind} failed")
+            return False
+    return run_upload('products', force=force, filename=filename, restart=restart, shared=shared)
+
+def run_inventory(filename=INVENTORY_FILE, refresh=False, force=False):
+    """Push stock levels and prices from a SKU feed to the store. Returns True when every row was synced."""
+    from inventory import sync_inventory
+    summary = sync_inventory(filename, refresh=refresh, force=force)
+    return summary is not None and not summary['failed']
+
+def build_parser():
+    """Build the command line parser."""
+    parser = argparse.ArgumentParser(description="Manage WooCommerce products, categories and tags. "
+                                                 "Run without arguments for the interactive menu.")
+    parser.add_argument('--metrics-report', default=METRICS_REPORT,
+                        help="also write the run metrics to this file: Prometheus text for .prom, JSON otherwise")
+    parser.add_argument('--stores', help=f"run the command on these stores from {STORES_FILE}: all, or comma-separated names")
+    parser.add_argument('--parallel', type=int, default=STORE_PARALLELISM,
+                        help=f"with --stores, how many stores run at once (default {STORE_PARALLELISM})")
+    parser.add_argument('--budget', type=int, default=GLOBAL_CONCURRENCY,
+                        help=f"with --stores, requests in flight shared by the stores running at once (default {GLOBAL_CONCURRENCY})")
+    commands = parser.add_subparsers(dest='command')
+
+    extract = commands.add_parser('extract', help="download data from the store into data/")
+    extract.add_argument('kind', nargs='?', default='products', choices=KINDS)
+    extract.add_argument('--full', action='store_true',
+                         help="re-download the whole catalog instead of only the products modified since the last sync")
+    extract.add_argument('--profile', choices=list(EXTRACT_PROFILES), default='full',
+                         help="product fields to extract; profiles other than full write data/products_<profile>.csv")
+    extract.add_argument('--file', help="product snapshot to write, CSV or Parquet (default: the profile's file)")
+    extract.add_argument('--restart', action='store_true', help="start over instead of resuming an interrupted extract")
+
+    upload = commands.add_parser('upload', help="upload data from data/ to the store")
+    upload.add_argument('kind', choices=KINDS)
+    upload.add_argument('--force', action='store_true', help="upload every product row, even unchanged ones")
+    upload.add_argument('--file', default=PRODUCTS_FILE, help="product snapshot to upload, CSV or Parquet")
+    upload.add_argument('--restart', action='store_true', help="start over instead of resuming an interrupted upload")
+    upload.add_argument('--shared-catalog', action='store_true',
+                        help="the file was extracted from another store: ignore its ids and match terms by slug or name")
+
+    restore_parser = commands.add_parser('restore', help="restore a backup to data/ or to the store")
+    restore_parser.add_argument('kind', choices=KINDS)
+    restore_parser.add_argument('--backup', help="backup name, e.g. products_backup_20240101_120000.json (prompted if omitted)")
+    restore_parser.add_argument('--before', help="use the latest backup taken at or before this time, e.g. 2024-01-01T12:00:00")
+    restore_parser.add_argument('--to-store', action='store_true', help="push the backup to the store instead of data/")
+    restore_parser.add_argument('--sku', action='append', default=[], help="with --to-store, only this SKU (or term slug); repeatable")
+    restore_parser.add_argument('--id', action='append', default=[], help="with --to-store, only this id; repeatable")
+    restore_parser.add_argument('--changed-only', action='store_true', help="with --to-store, only records that differ from the store")
+    restore_parser.add_argument('--yes', action='store_true', help="with --to-store, push without asking for confirmation")
+
+    sync = commands.add_parser('sync', help="upload categories, tags and then changed products")
+    sync.add_argument('--force', action='store_true', help="upload every product row, even unchanged ones")
+    sync.add_argument('--file', default=PRODUCTS_FILE, help="product snapshot to upload, CSV or Parquet")
+    sync.add_argument('--restart', action='store_true', help="start over instead of resuming interrupted uploads")
+    sync.add_argument('--shared-catalog', action='store_true',
+                      help="the file was extracted from another store: ignore its ids and match terms by slug or name")
+
+    inventory = commands.add_parser('inventory', help="push stock levels and prices from a SKU feed, sending only changed fields")
+    inventory.add_argument('--file', default=INVENTORY_FILE,
+                           help="feed with a sku column and any of stock_quantity, regular_price and sale_price (CSV or Parquet)")
+    inventory.add_argument('--refresh', action='store_true', help="crawl the SKU index again instead of using the cached one")
+    inventory.add_argument('--force', action='store_true', help="send every field in the feed, even unchanged ones")
+
+    jobs = commands.add_parser('jobs', help="show the latest extract and upload jobs and whether they completed")
+    jobs.add_argument('--limit', type=int, default=20)
+
+    commands.add_parser('stores', help=f"list the stores configured in {STORES_FILE}")
+    return parser
+
+def without_options(argv, options):
+    """Return `argv` without the given options and their values."""
+    result = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg in options:
+            skip = True
+        elif arg.split('=', 1)[0] not in options:
+            result.append(arg)
+    return result
+
+def run_command(args):
+    """Run a parsed command line in this process. Returns True on success."""
+    if args.command == 'extract':
+        return run_extract(args.kind, full=args.full, filename=args.file, profile=args.profile, restart=args.restart)
+    if args.command == 'upload':
+        return run_upload(args.kind, force=args.force, filename=args.file, restart=args.restart,
+                          shared=args.shared_catalog)
+    if args.command == 'restore':
+        return run_restore(args.kind, args.backup, args.before, args.to_store, args.id or None, args.sku or None,
+                           args.changed_only, args.yes)
+    if args.command == 'inventory':
+        return run_inventory(args.file, refresh=args.refresh, force=args.force)
+    if args.command == 'jobs':
+        from jobs import print_jobs
+        print_jobs(args.limit)
+        return True
+    if args.command == 'stores':
+        from stores import print_stores
+        print_stores()
+        return True
+    return run_sync(force=args.force, filename=args.file, restart=args.restart, shared=args.shared_catalog)
 
 def restore_backup():
     """This function restores a backup."""
     logging.info("Restoring a backup...")
     backup_type = input("Which backup do you want to restore? (1: Products, 2: Categories, 3: Tags, 4: Return to Product Management Menu): ")
-    
-    if backup_type == '1':
-        backup_dir = "products"
-    elif backup_type == '2':
-        backup_dir = "categories"
-    elif backup_type == '3':
-        backup_dir = "tags"
-    elif backup_type == '4':
+
+    if backup_type == '4':
         logging.info("Returning to main menu...")
-        return
+    elif backup_type in ('1', '2', '3'):
+        run_restore(KINDS[int(backup_type) - 1])
     else:
         print("Invalid option.")
 
-    subprocess.run(["python", "src/restore.py", backup_dir], check=True)
-
 def main_menu():
 
     while True:
@@ -57,12 +196,8 @@ def main_menu():
         print("5. Restore backup")
         print("6. Exit the program")
         choice = input("Please choose an option (1, 2, 3, 4, 5, 6): ")
-        if choice == '1':
-            fetch_products()
-        elif choice == '2':
-            fetch_categories()
-        elif choice == '3':
-            fetch_tags()
+        if choice in ('1', '2', '3'):
+            run_extract(KINDS[int(choice) - 1])
         elif choice == '4':
             while True:
                 print("\n*** Upload Menu ***")
@@ -71,12 +206,8 @@ def main_menu():
                 print("3. Upload tags")
                 print("4. Back to main menu")
                 upload_choice = input("Please choose an option (1, 2, 3, 4): ")
-                if upload_choice == '1':
-                    upload_data('products')
-                elif upload_choice == '2':
-                    upload_data('categories')
-                elif upload_choice == '3':
-                    upload_data('tags')
+                if upload_choice in ('1', '2', '3'):
+                    run_upload(KINDS[int(upload_choice) - 1])
                 elif upload_choice == '4':
                     break
                 else:
@@ -89,5 +220,33 @@ def main_menu():
         else:
             print("Invalid option, please try again.")
 
+def main(argv=None):
+    """Run a command given on the command line, or the interactive menu when there is none."""
+    argv = sys.argv[1:] if argv is None else argv
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        if args.stores:
+            parser.error("--stores needs a command")
+        main_menu()
+        return 0
+    if args.stores and args.command != 'stores':
+        from stores import fan_out
+        try:
+            return 0 if fan_out(without_options(argv, FAN_OUT_OPTIONS), args.command, args.stores,
+                                args.parallel, args.budget) else 1
+        except (OSError, ValueError) as e:
+            logging.error(f"{args.command} on stores {args.stores} failed: {e}")
+            return 1
+    from metrics import report_run
+    try:
+        return 0 if run_command(args) else 1
+    except Exception as e:
+        logging.error(f"{args.command} failed: {e}")
+        return 1
+    finally:
+        if args.command not in ('jobs', 'stores'):
+            report_run(args.metrics_report)
+
 if __name__ == '__main__':
-    main_menu()
+    sys.exit(main())
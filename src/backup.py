@@ -1,37 +1,48 @@
 import os
+import argparse
 import logging
 import sys
-from upload import read_products_from_csv, update_products_in_woocommerce
-from config import WOO_URL, CONSUMER_KEY, CONSUMER_SECRET
+import backup_store
+from client import get_wc_api
+from upload import (batch_update_in_woocommerce, chunked, format_category_data, format_product_data,
+                    format_tag_data, run_bounded)
 
 # Configuración del logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def list_backups(backup_dir="data/backups"):
-    """List all backup files in the backup directory, excluding .gitkeep."""
+# How each kind of backup is pushed back to the store
+KINDS = {
+    'products': ('products', format_product_data),
+    'categories': ('products/categories', format_category_data),
+    'tags': ('products/tags', format_tag_data),
+}
+
+# Number of changed records whose field differences are printed in the report
+REPORT_DETAIL_LIMIT = 50
+
+
+def list_backups(kind='products', backup_root='data/backups'):
+    """List the backups of a kind from the backup index, oldest first, as (name, created_at, row_count, format)."""
     try:
-        backups = [f for f in os.listdir(backup_dir) if os.path.isfile(os.path.join(backup_dir, f)) and f != '.gitkeep']
-        backups = [f for f in backups if not f.startswith('.')]  # Exclude hidden files and .gitkeep
-        backups.sort()  # Sort backups by name (which includes timestamp)
-        return backups
+        return backup_store.list_snapshots(kind, backup_root)
     except Exception as e:
-        logging.error(f"Error listing backup files: {e}")
+        logging.error(f"Error listing backups: {e}")
         return []
 
 def choose_backup(backups):
-    """Prompt the user to choose a backup file from the list."""
+    """Prompt the user to choose a backup from the list."""
     if not backups:
         print("No backup files found.")
         return None
 
     print("Available backup files:")
-    for i, backup in enumerate(backups, 1):
-        print(f"{i}. {backup}")
+    for i, (name, created_at, row_count, file_format) in enumerate(backups, 1):
+        print(f"{i}. {name} ({created_at}, {row_count} records, {file_format})")
 
     try:
         choice = int(input("Enter the number of the backup file to restore: ")) - 1
         if 0 <= choice < len(backups):
-            return backups[choice]
+            return backups[choice][0]
         else:
             print("Invalid choice.")
             return None
@@ -39,18 +50,133 @@ def choose_backup(backups):
         print("Invalid input.")
         return None
 
+def fetch_current_records(api, endpoint, ids):
+    """Fetch the current store state of records by id, 100 ids per request. Returns an id to record mapping."""
+    response = api.get(endpoint, params={"include": ",".join(ids), "per_page": 100})
+    response.raise_for_status()
+    return {str(item['id']): item for item in response.json()}
+
+def normalize_value(value):
+    """Make a formatted field comparable whether it came from CSV text, Parquet or the API."""
+    if value is None:
+        return ''
+    return value if isinstance(value, (list, dict)) else str(value)
+
+def changed_fields(backup_payload, current_payload):
+    """Return `{field: (current, backup)}` for the fields where the store differs from the backup."""
+    changes = {}
+    for key, value in backup_payload.items():
+        current = normalize_value(current_payload.get(key))
+        if normalize_value(value) != current:
+            changes[key] = (current, normalize_value(value))
+    return changes
+
+def compare_with_store(api, kind, records):
+    """Classify a page of backup records against the store as missing, changed or unchanged.
+
+    Returns a list of `(record, status, fields)` tuples, `fields` holding the
+    differing fields of changed records.
+    """
+    endpoint, format_func = KINDS[kind]
+    ids = [str(record['id']) for record in records if record.get('id') not in (None, '')]
+    current = fetch_current_records(api, endpoint, ids) if ids else {}
+    results = []
+    for record in records:
+        stored = current.get(str(record.get('id')))
+        if stored is None:
+            results.append((record, 'missing', {}))
+            continue
+        fields = changed_fields(format_func(record), format_func(stored))
+        results.append((record, 'changed' if fields else 'unchanged', fields))
+    return results
+
+def describe(record):
+    """Return a short label for a record in the diff report."""
+    record_id, sku = backup_store.record_keys(record)
+    return f"{sku or record.get('name')} (id {record_id})"
+
+def plan_restore(api, kind, manifest_path, ids=None, skus=None, only_changed=False):
+    """Compare the selected records of a backup with the store and report the differences.
+
+    Returns the status (missing, changed or unchanged) of every record to push,
+    keyed by id (or SKU, for records without an id). Nothing is sent to the store.
+    """
+    counts = {'missing': 0, 'changed': 0, 'unchanged': 0}
+    plan = {}
+    detailed = 0
+    pages = chunked(backup_store.iter_backup_records(manifest_path, ids=ids, skus=skus), 100)
+    for results in run_bounded(lambda page: compare_with_store(api, kind, page), pages):
+        for record, status, fields in results:
+            counts[status] += 1
+            if status != 'unchanged' or not only_changed:
+                record_id, sku = backup_store.record_keys(record)
+                plan[record_id or sku] = status
+            if status != 'unchanged' and detailed < REPORT_DETAIL_LIMIT:
+                detailed += 1
+                if status == 'missing':
+                    print(f"  + {describe(record)}: not in the store, will be created")
+                else:
+                    details = ', '.join(f"{key}: {current!r} -> {value!r}" for key, (current, value) in fields.items())
+                    print(f"  ~ {describe(record)}: {details}")
+    print(f"Backup vs store: {counts['missing']} missing, {counts['changed']} changed, {counts['unchanged']} unchanged; "
+          f"{len(plan)} records to push.")
+    return plan
+
+def push_records(api, kind, manifest_path, plan, ids=None, skus=None):
+    """Push the planned records of a backup to the store: update the ones that exist, create the missing ones."""
+    endpoint, format_func = KINDS[kind]
+
+    def planned():
+        for record in backup_store.iter_backup_records(manifest_path, ids=ids, skus=skus):
+            record_id, sku = backup_store.record_keys(record)
+            if (record_id or sku) in plan:
+                yield record
+
+    def to_payload(record):
+        payload = format_func(record)
+        record_id, sku = backup_store.record_keys(record)
+        if plan[record_id or sku] != 'missing':
+            payload['id'] = int(record_id)
+        return payload
+
+    return batch_update_in_woocommerce(api, planned(), endpoint, to_payload)
+
+def restore_to_store(kind, backup_name, ids=None, skus=None, only_changed=False, assume_yes=False,
+                     backup_root='data/backups'):
+    """Restore a backup (or some of its records) to the store, after reporting the diff with its current state."""
+    manifest_path = os.path.join(backup_store.manifest_dir(kind, backup_root), backup_name)
+    api = get_wc_api()
+    print(f"Comparing {backup_name} with the store...")
+    plan = plan_restore(api, kind, manifest_path, ids, skus, only_changed)
+    if not plan:
+        logging.info("Nothing to restore.")
+        return None
+    if not assume_yes and input(f"Push {len(plan)} records to the store? (y/N): ").strip().lower() != 'y':
+        logging.info("Restore cancelled, nothing was sent to the store.")
+        return None
+    return push_records(api, kind, manifest_path, plan, ids, skus)
+
 def main():
-    backups = list_backups()
-    backup_file = choose_backup(backups)
-    if backup_file:
-        backup_path = os.path.join("data/backups", backup_file)
-        products = read_products_from_csv(backup_path)
-        if products:
-            update_products_in_woocommerce(products)
-        else:
-            logging.info("No products found in the backup file.")
+    parser = argparse.ArgumentParser(description="Restore a backup, or some of its records, to the WooCommerce store.")
+    parser.add_argument('kind', nargs='?', default='products', choices=sorted(KINDS))
+    parser.add_argument('--backup', help="manifest name, e.g. products_backup_20240101_120000.json (prompted if omitted)")
+    parser.add_argument('--before', help="use the latest backup taken at or before this time, e.g. 2024-01-01T12:00:00")
+    parser.add_argument('--sku', action='append', default=[], help="restore only this SKU (or term slug); repeatable")
+    parser.add_argument('--id', action='append', default=[], help="restore only this id; repeatable")
+    parser.add_argument('--changed-only', action='store_true', help="push only records that differ from the store")
+    parser.add_argument('--yes', action='store_true', help="push without asking for confirmation")
+    args = parser.parse_args()
+
+    if args.backup:
+        backup_name = args.backup
+    elif args.before:
+        backup_name = backup_store.snapshot_before(args.kind, args.before)
+    else:
+        backup_name = choose_backup(list_backups(args.kind))
+    if backup_name:
+        restore_to_store(args.kind, backup_name, args.id or None, args.sku or None, args.changed_only, args.yes)
     else:
         logging.info("No backup file chosen.")
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,277 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+from snapshot import iter_snapshot_rows, open_snapshot_writer
+
+# Records per chunk: chunk boundaries fall on records whose hash is a multiple of
+# CHUNK_AVERAGE_RECORDS, so an edit only changes the chunk holding that record
+CHUNK_AVERAGE_RECORDS = 64
+CHUNK_MAX_RECORDS = 512
+
+
+def manifest_dir(kind, backup_root='data/backups'):
+    """Return the directory holding the backup manifests of a data kind."""
+    return os.path.join(backup_root, kind, 'manifests')
+
+def object_path(kind, chunk_hash, backup_root='data/backups'):
+    """Return the path of a stored chunk, sharded by the first two hex digits of its hash."""
+    return os.path.join(backup_root, kind, 'objects', chunk_hash[:2], f"{chunk_hash}.jsonl.gz")
+
+def encode_record(record):
+    """Serialize a record as one JSON line."""
+    return (json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=str) + '\n').encode('utf-8')
+
+def record_keys(record):
+    """Return the `(id, sku)` a record is looked up by; terms use their slug as SKU."""
+    record_id = record.get('id')
+    sku = record.get('sku') or record.get('slug')
+    return (None if record_id in (None, '') else str(record_id)), (sku or None)
+
+def iter_chunks(records):
+    """Group records into content-defined chunks, yielding `(encoded_lines, record_info)`.
+
+    `record_info` holds `(id, sku, record_hash)` for every record of the chunk.
+    A chunk ends after a record whose hash is a multiple of CHUNK_AVERAGE_RECORDS,
+    so inserting, removing or editing a record only changes the chunk around it
+    and every other chunk keeps its hash.
+    """
+    lines = []
+    info = []
+    for record in records:
+        line = encode_record(record)
+        digest = hashlib.sha256(line).digest()
+        lines.append(line)
+        info.append((*record_keys(record), digest.hex()))
+        boundary = int.from_bytes(digest[:4], 'big') % CHUNK_AVERAGE_RECORDS == 0
+        if boundary or len(lines) >= CHUNK_MAX_RECORDS:
+            yield b''.join(lines), info
+            lines = []
+            info = []
+    if lines:
+        yield b''.join(lines), info
+
+def store_chunk(kind, data, backup_root='data/backups'):
+    """Store a chunk once under its SHA-256 hash, compressed and read-only. Returns (hash, newly_stored)."""
+    chunk_hash = hashlib.sha256(data).hexdigest()
+    path = object_path(kind, chunk_hash, backup_root)
+    if os.path.exists(path):
+        return chunk_hash, False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with gzip.open(tmp_path, 'wb') as file:
+        file.write(data)
+    os.chmod(tmp_path, 0o444)
+    os.replace(tmp_path, path)
+    return chunk_hash, True
+
+def create_backup(original_file, kind, backup_root='data/backups'):
+    """Back up a CSV or Parquet data file into the deduplicated store of its kind.
+
+    The records are split into content-defined chunks and only chunks that are
+    not stored yet are written, so a backup of a file that barely changed costs
+    little more than its manifest. The manifest lists the chunks of this
+    point-in-time snapshot and is read-only, like the chunks. Returns the
+    manifest path.
+    """
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    manifest_path = os.path.join(manifest_dir(kind, backup_root), f"{kind}_backup_{timestamp}.json")
+    suffix = 1
+    while os.path.exists(manifest_path):
+        # Never overwrite a snapshot taken within the same second
+        suffix += 1
+        manifest_path = os.path.join(manifest_dir(kind, backup_root), f"{kind}_backup_{timestamp}_{suffix}.json")
+    logging.info(f"Creating backup of {original_file} as {manifest_path}...")
+    columns = []
+    seen_columns = set()
+
+    def records():
+        for row in iter_snapshot_rows(original_file):
+            for name in row:
+                if name not in seen_columns:
+                    seen_columns.add(name)
+                    columns.append(name)
+            yield row
+
+    chunks = []
+    index_rows = []
+    row_count = new_chunks = stored_bytes = 0
+    for data, info in iter_chunks(records()):
+        chunk_hash, stored = store_chunk(kind, data, backup_root)
+        chunks.append(chunk_hash)
+        index_rows.extend((row_count + offset, record_id, sku, record_hash, chunk_hash)
+                          for offset, (record_id, sku, record_hash) in enumerate(info))
+        row_count += len(info)
+        if stored:
+            new_chunks += 1
+            stored_bytes += os.path.getsize(object_path(kind, chunk_hash, backup_root))
+
+    manifest = {
+        'kind': kind,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'source': original_file,
+        'format': os.path.splitext(original_file)[1].lstrip('.') or 'csv',
+        'columns': columns,
+        'row_count': row_count,
+        'chunks': chunks,
+    }
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    with open(manifest_path, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file)
+    # Make the manifest read-only, like the chunks it points to
+    os.chmod(manifest_path, 0o444)
+    index_snapshot(manifest_path, manifest, index_rows, backup_root)
+    logging.info(f"Backup created as {manifest_path}: {row_count} records in {len(chunks)} chunks, "
+                 f"{new_chunks} new ({stored_bytes} bytes stored).")
+    return manifest_path
+
+def load_manifest(manifest_path):
+    """Read a backup manifest."""
+    with open(manifest_path, encoding='utf-8') as file:
+        return json.load(file)
+
+def iter_chunk_records(kind, chunk_hash, backup_root='data/backups'):
+    """Yield the records stored in one chunk."""
+    with gzip.open(object_path(kind, chunk_hash, backup_root), 'rb') as file:
+        for line in file:
+            yield json.loads(line)
+
+def iter_backup_records(manifest_path, backup_root='data/backups', ids=None, skus=None):
+    """Yield the records of a backup in their original order, one chunk in memory at a time.
+
+    With `ids` and/or `skus`, only the chunks holding those records are read,
+    as found through the backup index, and only those records are yielded.
+    """
+    manifest = load_manifest(manifest_path)
+    chunk_hashes = manifest['chunks']
+    if ids or skus:
+        ids = {str(record_id) for record_id in ids or []}
+        skus = set(skus or [])
+        wanted = set(find_record_chunks(manifest_path, ids, skus, backup_root))
+        chunk_hashes = [chunk_hash for chunk_hash in dict.fromkeys(chunk_hashes) if chunk_hash in wanted]
+    for chunk_hash in chunk_hashes:
+        for record in iter_chunk_records(manifest['kind'], chunk_hash, backup_root):
+            if ids or skus:
+                record_id, sku = record_keys(record)
+                if record_id not in ids and sku not in skus:
+                    continue
+            yield record
+
+def restore_backup_to_file(manifest_path, destination, backup_root='data/backups'):
+    """Rebuild the data file of a backup at `destination`, in the format of its extension."""
+    manifest = load_manifest(manifest_path)
+    with open_snapshot_writer(destination, manifest['columns']) as writer:
+        page = []
+        for record in iter_backup_records(manifest_path, backup_root):
+            page.append(record)
+            if len(page) >= 1000:
+                writer.write_rows(page)
+                page = []
+        writer.write_rows(page)
+    logging.info(f"Restored {manifest['row_count']} records from {manifest_path} to {destination}")
+
+def list_manifests(kind, backup_root='data/backups'):
+    """List the backup manifests of a data kind, oldest first."""
+    directory = manifest_dir(kind, backup_root)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(f for f in os.listdir(directory) if f.endswith('.json'))
+
+def index_path(backup_root='data/backups'):
+    """Return the path of the SQLite backup index."""
+    return os.path.join(backup_root, 'index.db')
+
+def connect_index(backup_root='data/backups'):
+    """Open the backup index, creating its tables on first use."""
+    os.makedirs(backup_root, exist_ok=True)
+    conn = sqlite3.connect(index_path(backup_root))
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS snapshots (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            name TEXT NOT NULL UNIQUE,
+            created_at TEXT NOT NULL,
+            row_count INTEGER NOT NULL,
+            format TEXT,
+            source TEXT
+        );
+        CREATE TABLE IF NOT EXISTS records (
+            snapshot_id INTEGER NOT NULL REFERENCES snapshots(id),
+            position INTEGER NOT NULL,
+            record_id TEXT,
+            sku TEXT,
+            record_hash TEXT NOT NULL,
+            chunk_hash TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS snapshots_kind ON snapshots (kind, created_at);
+        CREATE INDEX IF NOT EXISTS records_id ON records (snapshot_id, record_id);
+        CREATE INDEX IF NOT EXISTS records_sku ON records (snapshot_id, sku);
+    """)
+    return conn
+
+def index_snapshot(manifest_path, manifest, index_rows, backup_root='data/backups'):
+    """Record a backup's metadata and per-record hashes in the backup index."""
+    name = os.path.basename(manifest_path)
+    with closing(connect_index(backup_root)) as conn, conn:
+        conn.execute("DELETE FROM records WHERE snapshot_id IN (SELECT id FROM snapshots WHERE name = ?)", (name,))
+        conn.execute("DELETE FROM snapshots WHERE name = ?", (name,))
+        cursor = conn.execute(
+            "INSERT INTO snapshots (kind, name, created_at, row_count, format, source) VALUES (?, ?, ?, ?, ?, ?)",
+            (manifest['kind'], name, manifest['created_at'], manifest['row_count'],
+             manifest.get('format'), manifest.get('source')))
+        snapshot_id = cursor.lastrowid
+        conn.executemany("INSERT INTO records (snapshot_id, position, record_id, sku, record_hash, chunk_hash) VALUES (?, ?, ?, ?, ?, ?)",
+                         ((snapshot_id, *row) for row in index_rows))
+
+def reindex_manifests(kind, backup_root='data/backups'):
+    """Add manifests that are missing from the backup index, e.g. after the index was deleted."""
+    with closing(connect_index(backup_root)) as conn:
+        indexed = {row[0] for row in conn.execute("SELECT name FROM snapshots WHERE kind = ?", (kind,))}
+    for name in list_manifests(kind, backup_root):
+        if name in indexed:
+            continue
+        manifest_path = os.path.join(manifest_dir(kind, backup_root), name)
+        manifest = load_manifest(manifest_path)
+        index_rows = []
+        for chunk_hash in manifest['chunks']:
+            for record in iter_chunk_records(kind, chunk_hash, backup_root):
+                record_hash = hashlib.sha256(encode_record(record)).hexdigest()
+                index_rows.append((len(index_rows), *record_keys(record), record_hash, chunk_hash))
+        index_snapshot(manifest_path, manifest, index_rows, backup_root)
+        logging.info(f"Indexed backup {name}")
+
+def list_snapshots(kind, backup_root='data/backups'):
+    """Return `(name, created_at, row_count, format)` for every backup of a kind, oldest first."""
+    reindex_manifests(kind, backup_root)
+    with closing(connect_index(backup_root)) as conn:
+        return conn.execute("SELECT name, created_at, row_count, format FROM snapshots WHERE kind = ? ORDER BY created_at, name",
+                            (kind,)).fetchall()
+
+def snapshot_before(kind, when, backup_root='data/backups'):
+    """Return the name of the latest backup of a kind taken at or before `when` (an ISO timestamp), or None."""
+    reindex_manifests(kind, backup_root)
+    with closing(connect_index(backup_root)) as conn:
+        row = conn.execute("SELECT name FROM snapshots WHERE kind = ? AND created_at <= ? ORDER BY created_at DESC, name DESC LIMIT 1",
+                           (kind, when)).fetchone()
+    return row[0] if row else None
+
+def find_record_chunks(manifest_path, ids=(), skus=(), backup_root='data/backups'):
+    """Return the hashes of the chunks of a backup that hold the given record ids or SKUs."""
+    name = os.path.basename(manifest_path)
+    with closing(connect_index(backup_root)) as conn:
+        row = conn.execute("SELECT id FROM snapshots WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            reindex_manifests(load_manifest(manifest_path)['kind'], backup_root)
+            row = conn.execute("SELECT id FROM snapshots WHERE name = ?", (name,)).fetchone()
+        chunk_hashes = set()
+        for column, values in (('record_id', list(ids)), ('sku', list(skus))):
+            # Query in slices to stay under SQLite's bound parameter limit
+            for start in range(0, len(values), 500):
+                part = values[start:start + 500]
+                query = f"SELECT DISTINCT chunk_hash FROM records WHERE snapshot_id = ? AND {column} IN ({','.join('?' * len(part))})"
+                chunk_hashes.update(r[0] for r in conn.execute(query, (row[0], *part)))
+        return chunk_hashes
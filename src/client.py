@@ -0,0 +1,167 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from scheduler import get_scheduler
+from metrics import endpoint_label, record_request, record_retries
+from config import (WOO_URL, CONSUMER_KEY, CONSUMER_SECRET, VERSION, REQUEST_TIMEOUT,
+                    HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE, HTTP_GZIP, PER_PAGE, EXTRACT_CONCURRENCY)
+
+_lock = threading.Lock()
+_session = None
+_clients = {}
+
+
+def get_session():
+    """Return the process-wide pooled HTTP session, creating it on first use."""
+    global _session
+    import requests
+    from requests.adapters import HTTPAdapter
+    with _lock:
+        if _session is None:
+            session = requests.Session()
+            # pool_block keeps the number of open sockets at HTTP_POOL_MAXSIZE per host
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE, pool_block=True)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers['Accept-Encoding'] = 'gzip, deflate' if HTTP_GZIP else 'identity'
+            session.headers['Connection'] = 'keep-alive'
+            logging.debug(f"Created HTTP session with a pool of {HTTP_POOL_MAXSIZE} connections per host")
+            _session = session
+    return _session
+
+def session_request(method, url, **kwargs):
+    """Send a request through the pooled session and the store's request scheduler.
+
+    Has the signature of `requests.request`. The scheduler applies the rate limit,
+    adaptive concurrency and retries. Every attempt is recorded in the run metrics
+    under the URL's route.
+    """
+    scheduler = get_scheduler(urlsplit(url).netloc)
+    endpoint = endpoint_label(url)
+    body = kwargs.get('data')
+    bytes_out = len(body) if isinstance(body, (bytes, str)) else 0
+    attempts = 0
+
+    def attempt():
+        nonlocal attempts
+        attempts += 1
+        started = time.perf_counter()
+        try:
+            response = get_session().request(method=method, url=url, **kwargs)
+        except Exception:
+            record_request(method, endpoint, None, time.perf_counter() - started, bytes_out)
+            raise
+        # Reading the body here counts the download in the latency; callers read it right after anyway
+        content = response.content
+        # requests decodes gzip bodies, so count the bytes read off the wire rather than the decoded content
+        wire_bytes = getattr(response.raw, 'tell', None)
+        bytes_in = wire_bytes() if callable(wire_bytes) else len(content)
+        record_request(method, endpoint, response.status_code, time.perf_counter() - started, bytes_out, bytes_in)
+        return response
+
+    try:
+        return scheduler.send(method, attempt)
+    finally:
+        if attempts > 1:
+            record_retries(method, endpoint, attempts - 1)
+
+def get_wc_api(timeout=REQUEST_TIMEOUT):
+    """Return the shared WooCommerce API client for the given timeout.
+
+    woocommerce and requests are imported on the first call, so commands that
+    never reach the store do not pay for importing them.
+    """
+    import woocommerce.api
+    with _lock:
+        # woocommerce.API sends every call through the module-level `requests.request`, which
+        # opens and closes a new session (and TCP+TLS connection) per call. Route those calls
+        # through the pooled session and the scheduler so connections are kept alive and reused
+        # and every call made by extract, upload and utils is rate limited and retried.
+        woocommerce.api.request = session_request
+        if timeout not in _clients:
+            _clients[timeout] = woocommerce.api.API(
+                url=WOO_URL,
+                consumer_key=CONSUMER_KEY,
+                consumer_secret=CONSUMER_SECRET,
+                version=VERSION,
+                timeout=timeout
+            )
+        return _clients[timeout]
+
+def fetch_page(wc_api, endpoint, page, params=None):
+    """Fetch one page of a paginated listing endpoint and return the response."""
+    response = wc_api.get(endpoint, params={**(params or {}), "per_page": PER_PAGE, "page": page})
+    response.raise_for_status()
+    return response
+
+def iter_pages(wc_api, endpoint, params=None, concurrency=EXTRACT_CONCURRENCY, strict=False, start_page=1):
+    """Yield the items of every page of a listing endpoint, one list per page, in page order.
+
+    The first page is fetched alone to read the `X-WP-TotalPages` header, the rest
+    are fetched in parallel by at most `concurrency` workers, never more than
+    `2 * concurrency` pages ahead of the consumer, so memory stays proportional to
+    the window rather than the whole listing. If a page fails, the
+    pages before it have been yielded and iteration stops, as the sequential loop
+    used to do; with `strict` the error is raised instead. Pages before
+    `start_page` are skipped, e.g. to resume an interrupted listing.
+    """
+    try:
+        first = fetch_page(wc_api, endpoint, start_page, params)
+    except Exception as e:
+        logging.error(f"Error fetching {endpoint} on page {start_page}: {e}")
+        if strict:
+            raise
+        return
+    items = first.json()
+    yield items
+    total_pages = first.headers.get('X-WP-TotalPages')
+    if total_pages is None:
+        # Without the header fall back to walking pages until one comes back empty
+        page = start_page + 1
+        while items:
+            try:
+                items = fetch_page(wc_api, endpoint, page, params).json()
+            except Exception as e:
+                logging.error(f"Error fetching {endpoint} on page {page}: {e}")
+                if strict:
+                    raise
+                return
+            if items:
+                yield items
+            page += 1
+        return
+
+    total_pages = int(total_pages)
+    if total_pages <= start_page:
+        return
+    logging.info(f"Fetching {total_pages - start_page + 1} pages from {endpoint} with {concurrency} workers...")
+    window = deque()
+    next_page = start_page + 1
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        try:
+            while window or next_page <= total_pages:
+                while next_page <= total_pages and len(window) < 2 * max(1, concurrency):
+                    window.append((next_page, executor.submit(lambda page: fetch_page(wc_api, endpoint, page, params).json(), next_page)))
+                    next_page += 1
+                page, future = window.popleft()
+                try:
+                    items = future.result()
+                except Exception as e:
+                    logging.error(f"Error fetching {endpoint} on page {page}: {e}")
+                    if strict:
+                        raise
+                    return
+                yield items
+        finally:
+            for _, pending in window:
+                pending.cancel()
+
+def fetch_all_pages(wc_api, endpoint, params=None, concurrency=EXTRACT_CONCURRENCY, strict=False):
+    """Fetch every page of a listing endpoint and return the items in page order."""
+    items = []
+    for page_items in iter_pages(wc_api, endpoint, params, concurrency, strict):
+        items.extend(page_items)
+    return items
@@ -16,3 +16,72 @@ WORDPRESS_PASSWORD = os.getenv('WORDPRESS_PASSWORD')
 
 # WooCommerce API version
 VERSION = "wc/v3"
+
+# Batch uploads: items per request (WooCommerce caps batches at 100 items by default)
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', 100))
+BATCH_SIZE = min(int(os.getenv('BATCH_SIZE', MAX_BATCH_SIZE)), MAX_BATCH_SIZE)
+BATCH_MAX_RETRIES = int(os.getenv('BATCH_MAX_RETRIES', 3))
+
+# Extraction: items per listing page and how many pages are fetched at once
+PER_PAGE = min(int(os.getenv('PER_PAGE', 100)), 100)
+EXTRACT_CONCURRENCY = int(os.getenv('EXTRACT_CONCURRENCY', 8))
+VARIATION_CONCURRENCY = int(os.getenv('VARIATION_CONCURRENCY', 8))
+
+# HTTP client: request timeout (seconds), connection pool sizes and response compression
+REQUEST_TIMEOUT = float(os.getenv('REQUEST_TIMEOUT', 50))
+HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', 4))
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', 32))
+HTTP_GZIP = os.getenv('HTTP_GZIP', 'true').lower() in ('1', 'true', 'yes')
+
+# Incremental extracts re-check this many seconds before the last sync watermark
+SYNC_OVERLAP_SECONDS = int(os.getenv('SYNC_OVERLAP_SECONDS', 300))
+
+# Category/tag index cache: reused without any request for this many seconds, then revalidated
+TERM_CACHE_TTL = int(os.getenv('TERM_CACHE_TTL', 900))
+# The revalidation misses renames and slug changes, so the index is crawled again once it is this many seconds old
+TERM_CACHE_MAX_AGE = int(os.getenv('TERM_CACHE_MAX_AGE', 3600))
+
+# Request scheduler: rate limit (requests/second per store, 0 disables it), retries and adaptive concurrency
+RATE_LIMIT = float(os.getenv('RATE_LIMIT', 25))
+RATE_BURST = int(os.getenv('RATE_BURST', 50))
+MAX_RETRIES = int(os.getenv('MAX_RETRIES', 5))
+BACKOFF_BASE = float(os.getenv('BACKOFF_BASE', 0.5))
+BACKOFF_MAX = float(os.getenv('BACKOFF_MAX', 60))
+MIN_CONCURRENCY = int(os.getenv('MIN_CONCURRENCY', 1))
+MAX_CONCURRENCY = int(os.getenv('MAX_CONCURRENCY', HTTP_POOL_MAXSIZE))
+SLOW_RESPONSE_SECONDS = float(os.getenv('SLOW_RESPONSE_SECONDS', 10))
+UPLOAD_CONCURRENCY = int(os.getenv('UPLOAD_CONCURRENCY', 4))
+
+# Product snapshot format: csv, or parquet for a compressed, typed snapshot (needs pyarrow)
+SNAPSHOT_FORMAT = os.getenv('SNAPSHOT_FORMAT', 'csv')
+PRODUCTS_FILE = os.path.join('data', f"products.{SNAPSHOT_FORMAT}")
+
+# Product fields requested by each extract profile, in snapshot column order; None requests whole
+# products. Variants are only fetched by profiles that list them, with the same fields.
+EXTRACT_PROFILES = {
+    'full': None,
+    'pricing': ['id', 'sku', 'name', 'type', 'status', 'price', 'regular_price', 'sale_price',
+                'date_on_sale_from_gmt', 'date_on_sale_to_gmt', 'variants'],
+    'inventory': ['id', 'sku', 'name', 'type', 'status', 'manage_stock', 'stock_quantity', 'stock_status',
+                  'backorders', 'variants'],
+    'status': ['id', 'sku', 'name', 'type', 'status', 'date_modified_gmt'],
+}
+
+# Run metrics: file the end-of-run report is also written to (Prometheus text for .prom, JSON otherwise; empty for none)
+METRICS_REPORT = os.getenv('METRICS_REPORT') or None
+
+# Request payloads are only logged (at debug level) when LOG_PAYLOADS is set, for this fraction of requests
+LOG_PAYLOADS = os.getenv('LOG_PAYLOADS', 'false').lower() in ('1', 'true', 'yes')
+PAYLOAD_LOG_SAMPLE = float(os.getenv('PAYLOAD_LOG_SAMPLE', 0.01))
+
+# Multi-store runs: store profiles, the directory holding each store's data, how many stores run at
+# once and the requests in flight shared between them
+STORES_FILE = os.getenv('STORES_FILE', 'stores.json')
+STORES_DIR = os.getenv('STORES_DIR', 'stores')
+STORE_PARALLELISM = int(os.getenv('STORE_PARALLELISM', 4))
+GLOBAL_CONCURRENCY = int(os.getenv('GLOBAL_CONCURRENCY', 32))
+
+# Inventory sync: default SKU feed, and how long (seconds) the cached SKU index of products and variations is reused.
+# Changes are diffed against the index, so a store-side edit is only corrected once the index is crawled again
+INVENTORY_FILE = os.getenv('INVENTORY_FILE', os.path.join('data', 'inventory.csv'))
+INVENTORY_INDEX_TTL = int(os.getenv('INVENTORY_INDEX_TTL', 900))
@@ -0,0 +1,61 @@
+import hashlib
+import json
+import logging
+import os
+
+
+def hash_index_path(filename):
+    """Return the path of the content-hash sidecar index for a data file."""
+    return f"{os.path.splitext(filename)[0]}.hashes.json"
+
+def payload_hash(payload):
+    """Return a stable SHA-256 hash of an API payload."""
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+def record_key(item, payload):
+    """Return the key that identifies a row across extracts and uploads: its SKU, id or name."""
+    if payload.get('sku'):
+        return f"sku:{payload['sku']}"
+    if item.get('id'):
+        return f"id:{item['id']}"
+    return f"name:{payload.get('name')}"
+
+def load_hash_index(path):
+    """Load a content-hash index from disk, or return an empty one."""
+    try:
+        with open(path, encoding='utf-8') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logging.error(f"Error reading hash index {path}, treating every row as changed: {e}")
+        return {}
+
+def save_hash_index(index, path):
+    """Write a content-hash index to disk."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(index, file, separators=(',', ':'))
+    os.replace(tmp_path, path)
+    logging.info(f"Saved {len(index)} row hashes to {path}")
+
+def build_payload_hash_index(pairs):
+    """Build a content-hash index from `(row, payload)` pairs of rows already formatted for the API."""
+    return {record_key(item, payload): payload_hash(payload) for item, payload in pairs}
+
+def iter_payload_changes(pairs, index, counts):
+    """Lazily yield `(key, hash, payload, row number, row)` for `(row, payload)` pairs that differ from `index`.
+
+    New, changed and unchanged rows are tallied in `counts`.
+    """
+    for row, (item, payload) in enumerate(pairs, 1):
+        key = record_key(item, payload)
+        digest = payload_hash(payload)
+        previous = index.get(key)
+        if previous == digest:
+            counts['unchanged'] += 1
+            continue
+        counts['new' if previous is None else 'changed'] += 1
+        yield key, digest, payload, row, item
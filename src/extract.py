@@ -1,94 +1,324 @@
+import argparse
+import itertools
+import json
 import logging
 import os
-import pandas as pd
-from datetime import datetime
-from woocommerce import API
-from config import WOO_URL, CONSUMER_KEY, CONSUMER_SECRET
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import backup_store
+from client import get_wc_api, iter_pages, fetch_all_pages, fetch_page
+from jobs import start_job
+from metrics import add_rows, report_run, timer
+from diff import build_payload_hash_index, hash_index_path, load_hash_index, save_hash_index
+from snapshot import open_snapshot_writer, iter_snapshot_rows
+from upload import PRODUCT_COLUMNS, chunked, iter_formatted_products
+from config import EXTRACT_CONCURRENCY, VARIATION_CONCURRENCY, SYNC_OVERLAP_SECONDS, PRODUCTS_FILE, EXTRACT_PROFILES, METRICS_REPORT
 
 # Logging configuration
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
 
-def get_wc_api(timeout=50):
-    """Create and return a WooCommerce API client instance with a specified timeout."""
-    return API(
-        url=WOO_URL,
-        consumer_key=CONSUMER_KEY,
-        consumer_secret=CONSUMER_SECRET,
-        version="wc/v3",
-        timeout=timeout
-    )
+def profile_file(profile, file_format=None):
+    """Return the snapshot path of an extract profile: data/products.<format>, or data/products_<profile>.<format>."""
+    base, extension = os.path.splitext(PRODUCTS_FILE)
+    extension = f".{file_format}" if file_format else extension
+    return f"{base}{extension}" if profile == 'full' else f"{base}_{profile}{extension}"
 
-def get_variants(wc_api, product_id):
-    """Fetch variants for a variable product."""
+def get_variants(wc_api, product_id, strict=False, fields=None):
+    """Fetch all variants for a variable product through the given client, only `fields` when given."""
+    params = {"_fields": ",".join(fields)} if fields else None
+    return fetch_all_pages(wc_api, f"products/{product_id}/variations", params, concurrency=1, strict=strict)
+
+def iter_product_pages(concurrency=EXTRACT_CONCURRENCY, variation_concurrency=VARIATION_CONCURRENCY,
+                       modified_after=None, strict=False, fields=None, start_page=1):
+    """Yield pages of products from WooCommerce in page order, with the variants of variable products attached.
+
+    Variant fetches are queued on their own worker pool as soon as the page holding
+    the parent product arrives, so they run while later pages are still downloading.
+    A page is yielded once its variants are in; at most `concurrency` pages wait
+    on variants at a time. With `modified_after` (an ISO 8601 GMT timestamp) only
+    products changed since then are fetched. With `fields`, only those fields are
+    requested (through `_fields`), and variants only if `fields` includes them.
+    Products are listed by ascending id, so new products do not shift the pages
+    of a listing resumed from `start_page`.
+    """
+    params = {"orderby": "id", "order": "asc"}
+    if modified_after:
+        params.update({"modified_after": modified_after, "dates_are_gmt": "true"})
+    with_variants = fields is None or 'variants' in fields
+    variant_fields = None
+    if fields is not None:
+        variant_fields = [field for field in fields if field != 'variants']
+        product_fields = list(variant_fields)
+        if with_variants and 'type' not in product_fields:
+            # The type tells which products have variants
+            product_fields.append('type')
+        params["_fields"] = ",".join(product_fields)
     wc_api = get_wc_api()
-    try:
-        response = wc_api.get(f"products/{product_id}/variations")
-        #response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        logging.error(f"Error fetching variants for product {product_id}: {e}")
-        return []
+    waiting = deque()
+
+    def complete(page):
+        current_products, variant_futures = page
+        for product, future in variant_futures:
+            product['variants'] = future.result()
+        return current_products
+
+    with ThreadPoolExecutor(max_workers=max(1, variation_concurrency)) as variant_executor:
+        for current_products in iter_pages(wc_api, "products", params, concurrency, strict, start_page):
+            # If a product is variable, also fetch its variants
+            variant_futures = [(product, variant_executor.submit(get_variants, wc_api, product['id'], strict, variant_fields))
+                               for product in current_products if with_variants and product.get('type') == 'variable']
+            waiting.append((current_products, variant_futures))
+            while waiting and (len(waiting) > concurrency or all(future.done() for _, future in waiting[0][1])):
+                yield complete(waiting.popleft())
+        while waiting:
+            yield complete(waiting.popleft())
+
+def write_product_pages(writer, pages, job, start_page=1):
+    """Write pages of products, checkpointing each page in the job journal. Returns the ids written.
+
+    Products already written by an interrupted run of the job are skipped, as the
+    first pages of a resumed listing repeat what that run wrote.
+    """
+    written = set(job.items()) if job.resumed else set()
+    for page, current_products in enumerate(pages, start_page):
+        new_products = [product for product in current_products if str(product['id']) not in written]
+        new_ids = [str(product['id']) for product in new_products]
+        with timer('disk'):
+            writer.write_rows(new_products)
+            job.checkpoint(((product_id, None) for product_id in new_ids),
+                           {**job.state, 'pages': page, 'writer': writer.state()})
+        written.update(new_ids)
+        add_rows('extracted', len(new_products))
+    return written
 
-def get_all_products():
-    """Fetch all products from WooCommerce."""
-    all_products = []
-    page = 1
+def find_resume_page(job, start_page, modified_after=None):
+    """Return the page to resume an interrupted listing from, at or before the checkpointed `start_page`.
+
+    Products deleted since the interruption move later ones onto earlier pages,
+    so pages are checked backwards, one `_fields=id` request each, until one
+    starts with a product that was already written. Pages past the end of the
+    catalog are stepped over the same way.
+    """
+    written = set(job.items())
+    params = {"orderby": "id", "order": "asc", "_fields": "id"}
+    if modified_after:
+        params.update({"modified_after": modified_after, "dates_are_gmt": "true"})
     wc_api = get_wc_api()
-    while True:
+    page = start_page
+    while page > 1:
         try:
-            response = wc_api.get("products", params={"per_page": 100, "page": page})
-            response.raise_for_status()
-            current_products = response.json()
-            if not current_products:
-                break  # No more products, end loop
-            for product in current_products:
-                # If the product is variable, also fetch its variants
-                if product['type'] == 'variable':
-                    product['variants'] = get_variants(wc_api, product['id'])
-                all_products.append(product)
-            page += 1  # Increment page for next request
+            items = fetch_page(wc_api, "products", page, params).json()
         except Exception as e:
-            logging.error(f"Error fetching products on page {page}: {e}")
-            break  # Optional: Break on error or decide how to handle errors
-    return all_products
+            # WooCommerce answers 400 rest_post_invalid_page_number past the last page
+            if getattr(e, 'response', None) is None or e.response.status_code != 400:
+                raise
+            items = []
+        if items and str(items[0]['id']) in written:
+            break
+        page -= 1
+    return page
+
+def resume_state(job, filename):
+    """Return the writer state to resume an interrupted extract from, or None to start over."""
+    if job.resumed and job.state and job.state.get('writer') and os.path.exists(f"{filename}.partial"):
+        return job.state['writer']
+    return None
 
-def save_products_to_file(products, filename='data/products.csv'):
-    """Save product data to a CSV file using pandas."""
+def save_products_to_file(pages, filename=PRODUCTS_FILE, fieldnames=None, backup_kind='products', job=None, start_page=1):
+    """Save pages of product data to a CSV or Parquet file, writing each page to disk as it arrives.
+
+    The columns are `fieldnames` when given, otherwise every field of the products.
+    The file is replaced only once every page has been written; on error the
+    previous file is left untouched. With a `job`, every page is checkpointed and
+    on error the partial file is kept so the job can resume from its last page.
+    """
     logging.info(f"Saving product data to {filename}...")
-    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    writer = None
     try:
-        # Convert the list of products into a DataFrame
-        df = pd.DataFrame(products)
-        
-        # Save DataFrame to CSV
-        df.to_csv(filename, index=False)
+        writer = open_snapshot_writer(filename, fieldnames, resume_state(job, filename) if job else None)
+        if job:
+            write_product_pages(writer, pages, job, start_page)
+        else:
+            for current_products in pages:
+                with timer('disk'):
+                    writer.write_rows(current_products)
+                add_rows('extracted', len(current_products))
+        if not writer.rows_written:
+            writer.abort()
+            logging.info("No products to save.")
+            return False
+        writer.close()
         logging.info(f"Product data saved to {filename} successfully.")
-        
+
         # Create a backup of the file
-        create_backup(filename)
+        create_backup(filename, backup_kind)
+        return True
     except Exception as err:
+        if writer and not job:
+            writer.abort()
         logging.error(f"An error occurred while saving product data: {err}")
+        return False
+
+def merge_products_into_file(pages, filename=PRODUCTS_FILE, fieldnames=None, backup_kind='products', job=None, start_page=1):
+    """Merge pages of changed products into an existing CSV or Parquet file, replacing rows with the same id.
+
+    Changed rows are streamed to the new file first, then the existing rows whose
+    id did not change are copied after them, so only the set of changed ids is
+    held in memory. With a `job`, every page of changed products is checkpointed
+    and on error the partial file is kept so the job can resume from its last
+    page. Returns the set of changed ids, or None on error.
+    """
+    writer = None
+    try:
+        writer = open_snapshot_writer(filename, fieldnames, resume_state(job, filename) if job else None)
+        if job:
+            changed_ids = write_product_pages(writer, pages, job, start_page)
+        else:
+            changed_ids = set()
+            for current_products in pages:
+                with timer('disk'):
+                    writer.write_rows(current_products)
+                add_rows('extracted', len(current_products))
+                changed_ids.update(str(product['id']) for product in current_products)
+        if not changed_ids:
+            writer.abort()
+            return changed_ids
+        logging.info(f"Merging {len(changed_ids)} changed products into {filename}...")
+        unchanged = (row for row in iter_snapshot_rows(filename) if str(row['id']) not in changed_ids)
+        with timer('disk'):
+            # A page at a time: a Parquet writer holds each write in memory as one part file
+            for page in chunked(unchanged, 1000):
+                writer.write_rows(page)
+        writer.close()
+        logging.info(f"{len(changed_ids)} products merged into {filename}, {writer.rows_written} products in total.")
+
+        # Create a backup of the file
+        create_backup(filename, backup_kind)
+        return changed_ids
+    except Exception as err:
+        if writer and not job:
+            writer.abort()
+        logging.error(f"An error occurred while merging product data: {err}")
+        return None
+
+def update_hash_index(filename, changed_ids=None):
+    """Record the payload hashes of what the store holds now, so the next upload only sends rows edited since.
+
+    After a merge only the `changed_ids` rows came from the store; the other rows
+    may hold local edits not uploaded yet, so their hashes are kept as they were.
+    """
+    index_path = hash_index_path(filename)
+    rows = iter_snapshot_rows(filename, columns=['id'] + PRODUCT_COLUMNS)
+    if changed_ids is None or not os.path.exists(index_path):
+        save_hash_index(build_payload_hash_index(iter_formatted_products(rows)), index_path)
+    elif changed_ids:
+        index = load_hash_index(index_path)
+        # A merge writes the changed rows first
+        index.update(build_payload_hash_index(iter_formatted_products(itertools.islice(rows, len(changed_ids)))))
+        save_hash_index(index, index_path)
+
+def load_sync_watermark(resource='products', state_file='data/sync_state.json'):
+    """Return the timestamp of the last successful sync of a resource, or None."""
+    try:
+        with open(state_file, encoding='utf-8') as file:
+            return json.load(file).get(resource)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logging.error(f"Error reading sync state from {state_file}: {e}")
+        return None
+
+def save_sync_watermark(timestamp, resource='products', state_file='data/sync_state.json'):
+    """Record the timestamp of the last successful sync of a resource."""
+    state = {}
+    if os.path.exists(state_file):
+        with open(state_file, encoding='utf-8') as file:
+            state = json.load(file)
+    state[resource] = timestamp
+    os.makedirs(os.path.dirname(state_file), exist_ok=True)
+    with open(state_file, 'w', encoding='utf-8') as file:
+        json.dump(state, file, indent=2)
+    logging.info(f"Sync watermark for {resource} set to {timestamp}")
+
+def extract_products(full=False, filename=None, state_file='data/sync_state.json', profile='full', restart=False):
+    """Extract products to a CSV or Parquet snapshot, fetching only products changed since the last sync when possible.
+
+    A full extract runs when `full` is set, when there is no watermark yet or when
+    the output file is missing. Deleted products are only dropped by a full extract.
+    The profile picks the fields requested and the snapshot's columns; each profile
+    has its own file (`profile_file`), watermark and backups.
+
+    Progress is recorded in the job journal page by page. An extract that failed
+    or was killed leaves `<file>.partial` next to the untouched previous file and
+    is marked partial; the next run of the same extract resumes from its last
+    page, unless `restart` is set.
+    """
+    fields = EXTRACT_PROFILES[profile]
+    filename = filename or profile_file(profile)
+    resource = 'products' if profile == 'full' else f"products_{profile}"
+    watermark = None if full else load_sync_watermark(resource, state_file)
+    since = None
+    if watermark and os.path.exists(filename):
+        # Overlap the previous window a little to absorb clock skew between us and the store
+        since = datetime.fromisoformat(watermark) - timedelta(seconds=SYNC_OVERLAP_SECONDS)
+        since = since.strftime('%Y-%m-%dT%H:%M:%S')
+
+    params = {'profile': profile, 'since': since}
+    job = start_job('extract', filename, params, restart)
+    if job.resumed and resume_state(job, filename) is None:
+        # The interrupted run left nothing to continue from
+        job = start_job('extract', filename, params, restart=True)
+    start_page = 1
+    if job.resumed:
+        try:
+            start_page = find_resume_page(job, max(1, job.state['pages']), since)
+        except Exception as e:
+            logging.error(f"Extract failed, could not find where to resume {filename}: {e}")
+            job.finish('partial', f"{job.state['pages']} pages written to {filename}.partial, run the extract again to resume")
+            return False
+        logging.info(f"Resuming the extract of {filename} at page {start_page}")
+    else:
+        job.checkpoint(state={'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'), 'pages': 0})
+    pages = iter_product_pages(modified_after=since, strict=True, fields=fields, start_page=start_page)
+    if since:
+        logging.info(f"Fetching products modified after {since} ({profile} profile)...")
+        changed_ids = merge_products_into_file(pages, filename, fields, resource, job, start_page)
+        if changed_ids == set():
+            logging.info("No products changed since the last sync.")
+        saved = changed_ids is not None
+    else:
+        logging.info(f"Fetching the full product catalog ({profile} profile)...")
+        saved = save_products_to_file(pages, filename, fields, resource, job, start_page)
+    if not saved:
+        logging.error(f"Extract failed, {filename} and the sync watermark were left unchanged.")
+        job.finish('partial', f"{job.state['pages']} pages written to {filename}.partial, run the extract again to resume")
+    else:
+        update_hash_index(filename, changed_ids if since else None)
+        save_sync_watermark(job.state['started_at'], resource, state_file)
+        job.finish('completed')
+    return saved
 
-def create_backup(original_file):
-    """Create a backup of the CSV file with a timestamp in the filename."""
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    backup_filename = f"data/backups/products/products_backup_{timestamp}.csv"
-    logging.info(f"Creating backup of the file as {backup_filename}...")
+def create_backup(original_file, kind='products'):
+    """Back up the CSV or Parquet file into the deduplicated, read-only backup store."""
     try:
-        os.makedirs(os.path.dirname(backup_filename), exist_ok=True)
-        with open(original_file, 'rb') as src_file:
-            with open(backup_filename, 'wb') as backup_file:
-                backup_file.write(src_file.read())
-        logging.info(f"Backup created successfully as {backup_filename}.")
-        
-        # Make the backup file read-only
-        os.chmod(backup_filename, 0o444)  # Unix-based systems: read-only for all users
-        logging.info(f"Backup file {backup_filename} set to read-only.")
+        backup_store.create_backup(original_file, kind)
     except Exception as err:
         logging.error(f"An error occurred while creating the backup: {err}")
 
 if __name__ == '__main__':
-    products = get_all_products()
-    if products:
-        save_products_to_file(products)
+    parser = argparse.ArgumentParser(description="Extract products from WooCommerce to data/products.csv or .parquet.")
+    parser.add_argument('--full', action='store_true',
+                        help="re-download the whole catalog instead of only the products modified since the last sync")
+    parser.add_argument('--format', choices=['csv', 'parquet'],
+                        help="snapshot format (default: SNAPSHOT_FORMAT from the environment, csv if unset)")
+    parser.add_argument('--profile', choices=list(EXTRACT_PROFILES), default='full',
+                        help="fields to extract: full products, or only pricing, inventory or status fields")
+    parser.add_argument('--restart', action='store_true', help="start over instead of resuming an interrupted extract")
+    parser.add_argument('--metrics-report', default=METRICS_REPORT,
+                        help="also write the run metrics to this file: Prometheus text for .prom, JSON otherwise")
+    args = parser.parse_args()
+    extract_products(full=args.full, filename=profile_file(args.profile, args.format), profile=args.profile,
+                     restart=args.restart)
+    report_run(args.metrics_report)
@@ -0,0 +1,187 @@
+import argparse
+import json
+import logging
+import os
+import time
+from decimal import Decimal, InvalidOperation
+from client import get_wc_api, iter_pages, fetch_all_pages
+from metrics import add_rows, report_run
+from snapshot import iter_snapshot_rows
+from upload import chunked, run_bounded, upload_batch
+from config import BATCH_SIZE, VARIATION_CONCURRENCY, INVENTORY_FILE, INVENTORY_INDEX_TTL, METRICS_REPORT
+
+# Logging configuration
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Feed columns an inventory sync can change; any of them may be left out of the feed
+INVENTORY_FIELDS = ('stock_quantity', 'regular_price', 'sale_price')
+INDEX_FIELDS = ['id', 'sku', 'type', 'manage_stock', *INVENTORY_FIELDS]
+
+
+def sku_index_path(cache_dir='data/cache'):
+    """Return the path of the cached SKU index."""
+    return os.path.join(cache_dir, 'sku_index.json')
+
+def index_entry(item, parent_id=None):
+    """Return the SKU index entry of a product or variation: its ids and current inventory fields."""
+    return {'id': item['id'], 'parent_id': parent_id, 'manage_stock': item.get('manage_stock'),
+            **{field: item.get(field) for field in INVENTORY_FIELDS}}
+
+def fetch_sku_index(api):
+    """Crawl the SKU, ids and inventory fields of every product and variation in the store."""
+    entries = {}
+    variable_ids = []
+    for page in iter_pages(api, "products", {"_fields": ",".join(INDEX_FIELDS)}, strict=True):
+        for product in page:
+            if product.get('type') == 'variable':
+                variable_ids.append(product['id'])
+            if product.get('sku'):
+                entries[product['sku']] = index_entry(product)
+    params = {"_fields": ",".join(field for field in INDEX_FIELDS if field != 'type')}
+
+    def fetch_variations(parent_id):
+        return parent_id, fetch_all_pages(api, f"products/{parent_id}/variations", params, concurrency=1, strict=True)
+
+    for parent_id, variations in run_bounded(fetch_variations, variable_ids, VARIATION_CONCURRENCY):
+        for variation in variations:
+            if variation.get('sku'):
+                entries[variation['sku']] = index_entry(variation, parent_id)
+    return entries
+
+def save_sku_index(entries, fetched_at=None, cache_dir='data/cache'):
+    """Cache the SKU index on disk, keeping the time it was crawled."""
+    path = sku_index_path(cache_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as file:
+        json.dump({'fetched_at': fetched_at or time.time(), 'entries': entries}, file)
+    os.replace(f"{path}.tmp", path)
+
+def load_sku_index(api, refresh=False, cache_dir='data/cache'):
+    """Return `(entries, fetched_at)` of the SKU index, crawling the store when the cache is older than INVENTORY_INDEX_TTL."""
+    if not refresh:
+        try:
+            with open(sku_index_path(cache_dir), encoding='utf-8') as file:
+                index = json.load(file)
+            if time.time() - index['fetched_at'] < INVENTORY_INDEX_TTL:
+                return index['entries'], index['fetched_at']
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.error(f"Error reading the cached SKU index: {e}")
+    logging.info("Fetching the SKU index of products and variations from WooCommerce...")
+    entries = fetch_sku_index(api)
+    fetched_at = time.time()
+    save_sku_index(entries, fetched_at, cache_dir)
+    logging.info(f"Cached {len(entries)} SKUs in {sku_index_path(cache_dir)}")
+    return entries, fetched_at
+
+def comparable(field, value):
+    """Return a field value in a form where equal stock levels and prices compare equal, e.g. `9.9` and `9.90`."""
+    if value is None or str(value).strip() == '':
+        return None
+    try:
+        number = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(f"{field} is not a number: {value!r}")
+    return int(number) if field == 'stock_quantity' else number
+
+def inventory_changes(row, entry, force=False):
+    """Return the fields of a feed row that differ from the store's values in the index entry, or all of them with `force`.
+
+    Empty cells leave stock and regular price unchanged; an empty sale price ends the sale.
+    """
+    changes = {}
+    for field in INVENTORY_FIELDS:
+        if field not in row:
+            continue
+        value = '' if row[field] is None else str(row[field]).strip()
+        if value == '' and field != 'sale_price':
+            continue
+        if force or comparable(field, value) != comparable(field, entry.get(field)):
+            changes[field] = comparable(field, value) if field == 'stock_quantity' else value
+    if 'stock_quantity' in changes and not entry.get('manage_stock'):
+        # WooCommerce ignores the stock quantity of products that do not manage stock
+        changes['manage_stock'] = True
+    return changes
+
+def sync_inventory(filename=INVENTORY_FILE, refresh=False, force=False):
+    """Push the stock levels and prices of a SKU feed (CSV or Parquet) to the products and variations they belong to.
+
+    SKUs are resolved to product or variation ids through the cached SKU index,
+    and only the fields that differ from the index are sent, through the
+    `products/batch` and `products/<id>/variations/batch` endpoints. The index
+    is updated with what was sent, so until it is crawled again a field is
+    compared with the last value sent, not with the store's current value.
+    With `force`, every field in the feed is sent. Returns a summary with
+    counts and the feed rows that failed, or None when the sync could not start.
+    """
+    if not os.path.exists(filename):
+        logging.error(f"Inventory feed {filename} does not exist.")
+        return None
+    wc_api = get_wc_api()
+    try:
+        entries, fetched_at = load_sku_index(wc_api, refresh)
+    except Exception as e:
+        logging.error(f"Inventory sync aborted: the SKU index could not be built: {e}")
+        return None
+
+    counts = {'changed': 0, 'unchanged': 0, 'unknown': 0, 'invalid': 0}
+    operations = {}
+    unknown = []
+    invalid_rows = []
+    for row_number, row in enumerate(iter_snapshot_rows(filename, ['sku', *INVENTORY_FIELDS]), 1):
+        sku = (row.get('sku') or '').strip()
+        entry = entries.get(sku)
+        if entry is None:
+            counts['unknown'] += 1
+            unknown.append(sku)
+            continue
+        try:
+            changes = inventory_changes(row, entry, force)
+        except ValueError as e:
+            counts['invalid'] += 1
+            invalid_rows.append(row_number)
+            logging.error(f"Skipping row {row_number} (SKU {sku}): {e}")
+            continue
+        if not changes:
+            counts['unchanged'] += 1
+            continue
+        counts['changed'] += 1
+        endpoint = f"products/{entry['parent_id']}/variations" if entry['parent_id'] else "products"
+        operations.setdefault(endpoint, []).append((row_number, 'update', {'id': entry['id'], **changes}, sku))
+    logging.info(f"Inventory feed: {counts['changed']} changed, {counts['unchanged']} unchanged, "
+                 f"{counts['unknown']} unknown SKUs, {counts['invalid']} invalid rows")
+    if unknown:
+        logging.warning(f"SKUs not found in the store (run with --refresh if they were added since the index was built): "
+                        f"{', '.join(unknown[:20])}{' ...' if len(unknown) > 20 else ''}")
+
+    summary = {'updated': 0, 'failed': invalid_rows, **counts}
+    batches = [(endpoint, batch) for endpoint, ops in operations.items() for batch in chunked(ops, BATCH_SIZE)]
+    try:
+        for result in run_bounded(lambda batch: upload_batch(wc_api, *batch), batches):
+            summary['updated'] += result['updated']
+            summary['failed'].extend(result['failed'])
+            for _, _, payload, sku in result['succeeded']:
+                entries[sku].update({field: value for field, value in payload.items() if field != 'id'})
+            add_rows('synced', result['updated'])
+    finally:
+        # Keep what was sent even if the sync stopped halfway, so it is not sent again
+        save_sku_index(entries, fetched_at)
+    summary['failed'].sort()
+    logging.info(f"Inventory sync finished: {summary['updated']} updated, {len(summary['failed'])} failed, "
+                 f"{len(batches)} batch requests")
+    if summary['failed']:
+        logging.warning(f"Feed rows that could not be synced: {summary['failed']}")
+    return summary
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Push stock levels and prices from a SKU feed to WooCommerce.")
+    parser.add_argument('--file', default=INVENTORY_FILE,
+                        help="feed with a sku column and any of stock_quantity, regular_price and sale_price (CSV or Parquet)")
+    parser.add_argument('--refresh', action='store_true', help="crawl the SKU index again instead of using the cached one")
+    parser.add_argument('--force', action='store_true', help="send every field in the feed, even unchanged ones")
+    parser.add_argument('--metrics-report', default=METRICS_REPORT,
+                        help="also write the run metrics to this file: Prometheus text for .prom, JSON otherwise")
+    args = parser.parse_args()
+    sync_inventory(args.file, refresh=args.refresh, force=args.force)
+    report_run(args.metrics_report)
@@ -0,0 +1,133 @@
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import closing
+from datetime import datetime
+
+# Job states: running (or died while running), partial (stopped after an error) and completed
+UNFINISHED = ('running', 'partial')
+
+_lock = threading.Lock()
+
+
+def journal_path(data_dir='data'):
+    """Return the path of the SQLite job journal."""
+    return os.path.join(data_dir, 'jobs.db')
+
+def connect_journal(data_dir='data'):
+    """Open the job journal, creating its tables on first use."""
+    os.makedirs(data_dir, exist_ok=True)
+    conn = sqlite3.connect(journal_path(data_dir))
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            target TEXT NOT NULL,
+            params TEXT NOT NULL,
+            status TEXT NOT NULL,
+            started_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            state TEXT,
+            done INTEGER NOT NULL DEFAULT 0,
+            message TEXT
+        );
+        CREATE TABLE IF NOT EXISTS job_items (
+            job_id INTEGER NOT NULL REFERENCES jobs(id),
+            item TEXT NOT NULL,
+            value TEXT,
+            PRIMARY KEY (job_id, item)
+        );
+        CREATE INDEX IF NOT EXISTS jobs_target ON jobs (kind, target, status);
+    """)
+    return conn
+
+
+class Job:
+    """A resumable job in the journal: its checkpoint state and the items it has completed.
+
+    Created through `start_job`. `resumed` tells whether an unfinished run of the
+    same job was picked up, in which case `state` and `items()` hold what that run
+    had completed. `checkpoint()` records progress atomically, so a job that dies
+    at any point resumes from its last checkpoint.
+    """
+
+    def __init__(self, job_id, kind, target, state, resumed, data_dir='data'):
+        self.id = job_id
+        self.kind = kind
+        self.target = target
+        self.state = state
+        self.resumed = resumed
+        self.data_dir = data_dir
+
+    def items(self):
+        """Return the `{item: value}` mapping of the items completed so far."""
+        with closing(connect_journal(self.data_dir)) as conn:
+            return dict(conn.execute("SELECT item, value FROM job_items WHERE job_id = ?", (self.id,)))
+
+    def checkpoint(self, items=(), state=None):
+        """Record completed `(item, value)` pairs and, when given, the job's new state in one transaction."""
+        items = list(items)
+        with _lock, closing(connect_journal(self.data_dir)) as conn, conn:
+            conn.executemany("INSERT OR REPLACE INTO job_items (job_id, item, value) VALUES (?, ?, ?)",
+                             ((self.id, item, value) for item, value in items))
+            if state is not None:
+                self.state = state
+            conn.execute("UPDATE jobs SET state = ?, done = done + ?, updated_at = ? WHERE id = ?",
+                         (json.dumps(self.state), len(items), _now(), self.id))
+
+    def finish(self, status, message=None):
+        """Mark the job completed or partial; a completed job's items are dropped, as nothing will resume it."""
+        with _lock, closing(connect_journal(self.data_dir)) as conn, conn:
+            conn.execute("UPDATE jobs SET status = ?, message = ?, updated_at = ? WHERE id = ?",
+                         (status, message, _now(), self.id))
+            if status == 'completed':
+                conn.execute("DELETE FROM job_items WHERE job_id = ?", (self.id,))
+        log = logging.info if status == 'completed' else logging.warning
+        log(f"Job {self.id} ({self.kind} {self.target}) {status}" + (f": {message}" if message else ""))
+
+
+def _now():
+    return datetime.now().isoformat(timespec='seconds')
+
+def start_job(kind, target, params=None, restart=False, data_dir='data'):
+    """Start a job, resuming the unfinished run of the same kind, target and params unless `restart` is set.
+
+    An unfinished run with other params (for example an extract since another
+    date) cannot be resumed and is marked abandoned.
+    """
+    params_json = json.dumps(params or {}, sort_keys=True)
+    with _lock, closing(connect_journal(data_dir)) as conn, conn:
+        unfinished = conn.execute(
+            f"SELECT id, params, state FROM jobs WHERE kind = ? AND target = ? AND status IN ({','.join('?' * len(UNFINISHED))}) "
+            "ORDER BY id DESC", (kind, target, *UNFINISHED)).fetchall()
+        for job_id, job_params, state in unfinished:
+            if job_params == params_json and not restart:
+                conn.execute("UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ?", (_now(), job_id))
+                logging.info(f"Resuming job {job_id} ({kind} {target})")
+                return Job(job_id, kind, target, json.loads(state) if state else None, True, data_dir)
+            conn.execute("UPDATE jobs SET status = 'abandoned', updated_at = ? WHERE id = ?", (_now(), job_id))
+            conn.execute("DELETE FROM job_items WHERE job_id = ?", (job_id,))
+        cursor = conn.execute("INSERT INTO jobs (kind, target, params, status, started_at, updated_at) VALUES (?, ?, ?, 'running', ?, ?)",
+                              (kind, target, params_json, _now(), _now()))
+        return Job(cursor.lastrowid, kind, target, None, False, data_dir)
+
+def list_jobs(limit=20, data_dir='data'):
+    """Return `(id, kind, target, status, started_at, updated_at, done, message)` of the latest jobs, newest first."""
+    with closing(connect_journal(data_dir)) as conn:
+        return conn.execute("SELECT id, kind, target, status, started_at, updated_at, done, message FROM jobs "
+                            "ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+
+def print_jobs(limit=20, data_dir='data'):
+    """Print the latest jobs and their status."""
+    jobs = list_jobs(limit, data_dir)
+    if not jobs:
+        print("No jobs recorded.")
+    for job_id, kind, target, status, started_at, updated_at, done, message in jobs:
+        print(f"{job_id:>5}  {kind:<8} {target:<28} {status:<10} started {started_at}, updated {updated_at}, "
+              f"{done} items" + (f" - {message}" if message else ""))
+
+if __name__ == '__main__':
+    print_jobs(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
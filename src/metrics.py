@@ -0,0 +1,187 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float('inf'))
+
+_lock = threading.Lock()
+_requests = {}
+_rows = {}
+_phases = {}
+_started = time.perf_counter()
+
+
+def endpoint_label(url):
+    """Return the REST route of a request URL with ids replaced, e.g. `products/{id}/variations`."""
+    path = urlsplit(url).path
+    path = re.sub(r'^.*?/wp-json/wc/v\d+/', '', path).strip('/')
+    return re.sub(r'(?<=/)\d+(?=/|$)', '{id}', path) or '/'
+
+def _new_request_stats():
+    return {'count': 0, 'errors': 0, 'retries': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+            'bytes_out': 0, 'bytes_in': 0, 'buckets': [0] * len(LATENCY_BUCKETS), 'statuses': {}}
+
+def record_request(method, endpoint, status, seconds, bytes_out=0, bytes_in=0):
+    """Record one HTTP attempt; `status` is the HTTP status code, or None when no response came back."""
+    with _lock:
+        stats = _requests.setdefault((method.upper(), endpoint), _new_request_stats())
+        stats['count'] += 1
+        stats['seconds'] += seconds
+        stats['max_seconds'] = max(stats['max_seconds'], seconds)
+        stats['bytes_out'] += bytes_out
+        stats['bytes_in'] += bytes_in
+        if status is None or status >= 400:
+            stats['errors'] += 1
+        label = str(status) if status is not None else 'error'
+        stats['statuses'][label] = stats['statuses'].get(label, 0) + 1
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                stats['buckets'][index] += 1
+                break
+
+def record_retries(method, endpoint, retries):
+    """Record the retries the scheduler made for one call."""
+    with _lock:
+        _requests.setdefault((method.upper(), endpoint), _new_request_stats())['retries'] += retries
+
+def add_rows(name, count):
+    """Count rows processed by a stage, e.g. `extracted` or `uploaded`."""
+    with _lock:
+        _rows[name] = _rows.get(name, 0) + count
+
+@contextmanager
+def timer(phase):
+    """Add the time spent in the block to a phase, e.g. `formatting` or `disk`."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        with _lock:
+            _phases[phase] = _phases.get(phase, 0.0) + elapsed
+
+def reset():
+    """Forget everything recorded so far and restart the run clock."""
+    global _started
+    with _lock:
+        _requests.clear()
+        _rows.clear()
+        _phases.clear()
+        _started = time.perf_counter()
+
+def quantile(stats, q):
+    """Estimate a latency quantile from the histogram, as the upper bound of the bucket it falls in."""
+    target = q * stats['count']
+    seen = 0
+    for bound, count in zip(LATENCY_BUCKETS, stats['buckets']):
+        seen += count
+        if count and seen >= target:
+            return min(bound, stats['max_seconds'])
+    return stats['max_seconds']
+
+def summary():
+    """Return everything recorded in this run as a JSON-serializable dict."""
+    with _lock:
+        wall = time.perf_counter() - _started
+        requests = []
+        for (method, endpoint), stats in sorted(_requests.items(), key=lambda item: (item[0][1], item[0][0])):
+            requests.append({
+                'method': method, 'endpoint': endpoint,
+                'count': stats['count'], 'errors': stats['errors'], 'retries': stats['retries'],
+                'statuses': dict(stats['statuses']),
+                'seconds': round(stats['seconds'], 6), 'max_seconds': round(stats['max_seconds'], 6),
+                'p50_seconds': quantile(stats, 0.5) if stats['count'] else None,
+                'p95_seconds': quantile(stats, 0.95) if stats['count'] else None,
+                'bytes_out': stats['bytes_out'], 'bytes_in': stats['bytes_in'],
+                'buckets': {str(bound): count for bound, count in zip(LATENCY_BUCKETS, stats['buckets'])},
+            })
+        network = sum(stats['seconds'] for stats in _requests.values())
+        return {
+            'wall_seconds': round(wall, 6),
+            'requests': requests,
+            'rows': dict(_rows),
+            'rows_per_second': {name: round(count / wall, 2) for name, count in _rows.items()} if wall else {},
+            # Network time adds up the requests, which overlap when sent concurrently
+            'phases': {'network': round(network, 6), **{name: round(seconds, 6) for name, seconds in _phases.items()}},
+        }
+
+def format_summary(report):
+    """Render a run summary as a plain-text table."""
+    lines = [f"Run finished in {report['wall_seconds']:.2f}s"]
+    if report['requests']:
+        lines.append(f"{'request':<40} {'count':>7} {'errors':>6} {'retries':>7} {'p50':>7} {'p95':>7} {'max':>7} "
+                     f"{'KB out':>9} {'KB in':>9}")
+        for stats in report['requests']:
+            lines.append(f"{stats['method'] + ' ' + stats['endpoint']:<40} {stats['count']:>7} {stats['errors']:>6} "
+                         f"{stats['retries']:>7} {stats['p50_seconds']:>6.2f}s {stats['p95_seconds']:>6.2f}s "
+                         f"{stats['max_seconds']:>6.2f}s {stats['bytes_out'] / 1024:>9.1f} {stats['bytes_in'] / 1024:>9.1f}")
+    for name, count in report['rows'].items():
+        lines.append(f"Rows {name}: {count} ({report['rows_per_second'].get(name, 0):.1f} rows/s)")
+    phases = ', '.join(f"{name} {seconds:.2f}s" for name, seconds in report['phases'].items())
+    lines.append(f"Time by phase: {phases}")
+    return '\n'.join(lines)
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels.items()) + '}'
+
+def format_prometheus(report):
+    """Render a run summary in the Prometheus text exposition format, for the node exporter's textfile collector."""
+    lines = [
+        '# HELP woocommerce_request_duration_seconds Latency of WooCommerce API requests.',
+        '# TYPE woocommerce_request_duration_seconds histogram',
+    ]
+    for stats in report['requests']:
+        labels = {'method': stats['method'], 'endpoint': stats['endpoint']}
+        cumulative = 0
+        for bound, count in stats['buckets'].items():
+            cumulative += count
+            le = '+Inf' if bound == 'inf' else bound
+            lines.append(f"woocommerce_request_duration_seconds_bucket{_labels(**labels, le=le)} {cumulative}")
+        lines.append(f"woocommerce_request_duration_seconds_sum{_labels(**labels)} {stats['seconds']}")
+        lines.append(f"woocommerce_request_duration_seconds_count{_labels(**labels)} {stats['count']}")
+    for name, key, help_text in (('errors', 'errors', 'Requests that failed or returned HTTP 4xx/5xx.'),
+                                 ('retries', 'retries', 'Requests retried by the scheduler.')):
+        lines += [f"# HELP woocommerce_request_{name}_total {help_text}", f"# TYPE woocommerce_request_{name}_total counter"]
+        lines += [f"woocommerce_request_{name}_total{_labels(method=s['method'], endpoint=s['endpoint'])} {s[key]}"
+                  for s in report['requests']]
+    lines += ['# HELP woocommerce_request_bytes_total Request and response body bytes as transferred, before decompression.',
+              '# TYPE woocommerce_request_bytes_total counter']
+    for stats in report['requests']:
+        for direction in ('out', 'in'):
+            labels = _labels(method=stats['method'], endpoint=stats['endpoint'], direction=direction)
+            lines.append(f"woocommerce_request_bytes_total{labels} {stats[f'bytes_{direction}']}")
+    lines += ['# HELP woocommerce_rows_total Rows processed by each stage.', '# TYPE woocommerce_rows_total counter']
+    lines += [f"woocommerce_rows_total{_labels(stage=name)} {count}" for name, count in report['rows'].items()]
+    lines += ['# HELP woocommerce_phase_seconds Time spent per phase.', '# TYPE woocommerce_phase_seconds gauge']
+    lines += [f"woocommerce_phase_seconds{_labels(phase=name)} {seconds}" for name, seconds in report['phases'].items()]
+    lines += ['# HELP woocommerce_run_seconds Wall time of the run.', '# TYPE woocommerce_run_seconds gauge',
+              f"woocommerce_run_seconds {report['wall_seconds']}"]
+    return '\n'.join(lines) + '\n'
+
+def write_report(path, report=None):
+    """Write the run summary to `path`: Prometheus text format for `.prom` files, JSON otherwise."""
+    report = report or summary()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        if path.endswith('.prom'):
+            file.write(format_prometheus(report))
+        else:
+            json.dump(report, file, indent=2)
+    # Replace atomically, so a collector never reads a half-written file
+    os.replace(tmp_path, path)
+    logging.info(f"Wrote the run metrics to {path}")
+
+def report_run(path=None):
+    """Print the run summary and, when `path` is given, also write it to that file."""
+    report = summary()
+    print(format_summary(report))
+    if path:
+        write_report(path, report)
+    return report
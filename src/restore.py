@@ -1,17 +1,18 @@
 import sys
 import os
 import logging
-import pandas as pd
+import shutil
+from backup_store import list_snapshots, manifest_dir, load_manifest, restore_backup_to_file
 
 # Logging configuration
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
 
 def list_backups(backup_dir):
-    """List all backup files in the specified backup directory."""
+    """List all backups in the specified backup directory: older full copies, then store snapshots from the backup index."""
     try:
-        backups = [f for f in os.listdir(backup_dir) if os.path.isfile(os.path.join(backup_dir, f)) and not f.startswith('.')]
-        backups.sort()
+        backups = sorted(f for f in os.listdir(backup_dir) if os.path.isfile(os.path.join(backup_dir, f)) and not f.startswith('.'))
+        backups.extend(name for name, *_ in list_snapshots(os.path.basename(backup_dir), os.path.dirname(backup_dir)))
         return backups
     except Exception as e:
         logging.error(f"Error listing backup files: {e}")
@@ -38,18 +39,28 @@ def choose_backup(backups):
         print("Invalid input.")
         return None
 
-def restore_backup(backup_dir):
-    """Restore a backup from the specified directory."""
-    backups = list_backups(f"data/backups/{backup_dir}")
-    backup_file = choose_backup(backups)
-    if backup_file:
+def restore_backup(backup_dir, backup_file=None):
+    """Restore a backup from the specified directory, asking which one unless `backup_file` is given.
+
+    Returns True when a backup was restored.
+    """
+    if backup_file is None:
+        backup_file = choose_backup(list_backups(f"data/backups/{backup_dir}"))
+    if backup_file and backup_file.endswith('.json'):
+        # A manifest of the deduplicated store: rebuild the file from its chunks
+        manifest_path = os.path.join(manifest_dir(backup_dir), backup_file)
+        restore_path = os.path.join("data", f"{backup_dir}.{load_manifest(manifest_path)['format']}")
+        restore_backup_to_file(manifest_path, restore_path)
+    elif backup_file:
         backup_path = os.path.join(f"data/backups/{backup_dir}", backup_file)
-        restore_path = os.path.join("data", f"{backup_dir}.csv")
-        df = pd.read_csv(backup_path)
-        df.to_csv(restore_path, index=False)
+        restore_path = os.path.join("data", f"{backup_dir}{os.path.splitext(backup_file)[1]}")
+        # Copy the file in fixed-size blocks instead of parsing it, so memory stays flat
+        shutil.copyfile(backup_path, restore_path)
         logging.info(f"Restored {backup_dir} data from {backup_path} to {restore_path}")
     else:
         logging.info("No backup file chosen.")
+        return False
+    return True
 
 if __name__ == '__main__':
     if len(sys.argv) != 2:
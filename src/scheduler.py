@@ -0,0 +1,149 @@
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from config import (RATE_LIMIT, RATE_BURST, MAX_RETRIES, BACKOFF_BASE, BACKOFF_MAX,
+                    MIN_CONCURRENCY, MAX_CONCURRENCY, SLOW_RESPONSE_SECONDS)
+
+# Statuses that mean "try again later"; only 429 and 503 guarantee the request was not processed
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+SAFE_RETRY_STATUSES = {429, 503}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+_lock = threading.Lock()
+_schedulers = {}
+
+
+def never_sent(error):
+    """Tell whether a failed request certainly never reached the store: the connection could not be opened."""
+    import requests
+    from urllib3.exceptions import NewConnectionError
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    # Refused or unresolved connections come wrapped in a MaxRetryError; "Connection aborted" may follow a processed body
+    reason = getattr(error.args[0], 'reason', None) if isinstance(error, requests.ConnectionError) and error.args else None
+    return isinstance(reason, NewConnectionError)
+
+def parse_retry_after(value):
+    """Return the number of seconds a `Retry-After` header asks to wait, or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class RequestScheduler:
+    """Rate limiting, retries and adaptive concurrency for the requests sent to one store.
+
+    A token bucket caps the request rate. The number of requests in flight adapts
+    AIMD-style: it grows by one per window of successful responses and halves when
+    the store answers 429/5xx, times out or responds slower than SLOW_RESPONSE_SECONDS.
+    Failed requests are retried with exponential backoff and full jitter, honouring
+    `Retry-After`, which also pauses every other request to the store.
+    """
+
+    def __init__(self, rate=RATE_LIMIT, burst=RATE_BURST, max_retries=MAX_RETRIES,
+                 min_concurrency=MIN_CONCURRENCY, max_concurrency=MAX_CONCURRENCY):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_retries = max_retries
+        self.min_concurrency = max(1, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.concurrency = float(self.max_concurrency)
+        self.in_flight = 0
+        self.tokens = float(self.burst)
+        self.last_refill = time.monotonic()
+        self.paused_until = 0.0
+        self.condition = threading.Condition()
+
+    def _acquire(self):
+        """Wait for a free concurrency slot and a rate-limit token."""
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                if self.rate > 0:
+                    self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+                    self.last_refill = now
+                wait = self.paused_until - now
+                if wait <= 0 and self.in_flight >= int(self.concurrency):
+                    wait = None  # woken up by _release
+                elif wait <= 0 and self.rate > 0 and self.tokens < 1:
+                    wait = (1 - self.tokens) / self.rate
+                elif wait <= 0:
+                    self.in_flight += 1
+                    if self.rate > 0:
+                        self.tokens -= 1
+                    return
+                self.condition.wait(wait)
+
+    def _release(self, congested, slow=False):
+        """Free a concurrency slot and adapt the concurrency limit to how the store responded."""
+        with self.condition:
+            self.in_flight -= 1
+            if congested or slow:
+                previous = int(self.concurrency)
+                self.concurrency = max(self.min_concurrency, self.concurrency / 2)
+                if int(self.concurrency) < previous:
+                    logging.warning(f"Store is {'slow' if slow and not congested else 'overloaded'}, "
+                                    f"reducing concurrency to {int(self.concurrency)}")
+            else:
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+            self.condition.notify_all()
+
+    def _pause(self, seconds):
+        """Hold back every request to the store for the given number of seconds."""
+        with self.condition:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def backoff(self, attempt):
+        """Return the exponential backoff delay with full jitter for a retry attempt."""
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+    def send(self, method, send_func):
+        """Call `send_func()` (which returns a `requests.Response`) under the rate limit, with retries."""
+        import requests
+        attempt = 0
+        while True:
+            self._acquire()
+            started = time.monotonic()
+            try:
+                response = send_func()
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._release(congested=True)
+                # A call that got as far as sending its body may have been processed, so only retry idempotent ones
+                retry = method.upper() in IDEMPOTENT_METHODS or never_sent(e)
+                if not retry or attempt >= self.max_retries:
+                    raise
+                delay = self.backoff(attempt)
+                logging.warning(f"{method} request failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+            else:
+                congested = response.status_code in RETRY_STATUSES
+                self._release(congested, slow=time.monotonic() - started > SLOW_RESPONSE_SECONDS)
+                if not congested:
+                    return response
+                retry = response.status_code in SAFE_RETRY_STATUSES or method.upper() in IDEMPOTENT_METHODS
+                if not retry or attempt >= self.max_retries:
+                    return response
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                delay = max(retry_after or 0, self.backoff(attempt))
+                if retry_after is not None:
+                    self._pause(retry_after)
+                logging.warning(f"{method} request got HTTP {response.status_code}, retrying in {delay:.1f}s")
+            attempt += 1
+            time.sleep(delay)
+
+
+def get_scheduler(host):
+    """Return the shared request scheduler for a store host."""
+    with _lock:
+        if host not in _schedulers:
+            _schedulers[host] = RequestScheduler()
+        return _schedulers[host]
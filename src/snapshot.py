@@ -0,0 +1,305 @@
+import csv
+import glob
+import json
+import logging
+import os
+import shutil
+import sys
+
+# Parquet schema metadata key listing the columns stored as JSON text
+JSON_COLUMNS_KEY = b'json_columns'
+
+
+def format_csv_value(value):
+    """Format a value for CSV the way `DataFrame.to_csv` does: empty for None, `str()` otherwise."""
+    if value is None:
+        return ''
+    return value if isinstance(value, str) else str(value)
+
+
+class CsvSnapshotWriter:
+    """Write rows to a CSV file incrementally, one page at a time.
+
+    Rows are appended to `<path>.partial` as they arrive, so memory holds one page
+    at most. Columns are taken from `fieldnames` when given, otherwise from the rows
+    in order of first appearance. Columns first seen after some rows were already
+    written are added to the header when the file is finalized, and earlier rows
+    are padded with empty values. `close()` moves the finished file into place.
+    With `resume_state`, as returned by `state()`, the partial file of an
+    interrupted run is continued from that point.
+    """
+
+    def __init__(self, path, fieldnames=None, resume_state=None):
+        self.path = path
+        self.partial_path = f"{path}.partial"
+        self.fieldnames = list(fieldnames) if fieldnames else []
+        self.fixed_schema = bool(fieldnames)
+        self.grew = False
+        self.rows_written = 0
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if resume_state:
+            self.fieldnames = resume_state['fieldnames']
+            self.fixed_schema = resume_state['fixed_schema']
+            self.grew = resume_state['grew']
+            self.rows_written = resume_state['rows_written']
+            # Drop whatever was written after the last checkpoint
+            with open(self.partial_path, 'r+b') as file:
+                file.truncate(resume_state['size'])
+            self.file = open(self.partial_path, 'a', encoding='utf-8', newline='')
+        else:
+            self.file = open(self.partial_path, 'w', encoding='utf-8', newline='')
+        self.columns = set(self.fieldnames)
+        self.writer = csv.writer(self.file, lineterminator='\n')
+
+    def write_rows(self, rows):
+        """Append a page of row dicts to the file."""
+        for row in rows:
+            if not self.fixed_schema:
+                for key in row:
+                    if key not in self.columns:
+                        self.columns.add(key)
+                        self.fieldnames.append(key)
+                        self.grew = self.grew or self.rows_written > 0
+            self.writer.writerow([format_csv_value(row.get(name)) for name in self.fieldnames])
+            self.rows_written += 1
+
+    def state(self):
+        """Flush the rows written so far to disk and return what is needed to resume after them."""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return {'fieldnames': list(self.fieldnames), 'fixed_schema': self.fixed_schema, 'grew': self.grew,
+                'rows_written': self.rows_written, 'size': os.path.getsize(self.partial_path)}
+
+    def close(self):
+        """Write the header, pad rows written before the schema grew and move the file into place."""
+        self.file.close()
+        final_tmp = f"{self.path}.tmp"
+        width = len(self.fieldnames)
+        with open(self.partial_path, encoding='utf-8', newline='') as body, \
+                open(final_tmp, 'w', encoding='utf-8', newline='') as output:
+            csv.writer(output, lineterminator='\n').writerow(self.fieldnames)
+            if self.grew:
+                writer = csv.writer(output, lineterminator='\n')
+                for row in csv.reader(body):
+                    writer.writerow(row + [''] * (width - len(row)))
+            else:
+                shutil.copyfileobj(body, output)
+        os.replace(final_tmp, self.path)
+        os.remove(self.partial_path)
+        logging.info(f"Wrote {self.rows_written} rows with {width} columns to {self.path}")
+
+    def abort(self):
+        """Discard the partial file, leaving any previous file at `path` untouched."""
+        self.file.close()
+        if os.path.exists(self.partial_path):
+            os.remove(self.partial_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+def import_pyarrow():
+    """Import pyarrow, which is only needed for Parquet snapshots."""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Parquet snapshots need pyarrow, install it with `pip install pyarrow`") from e
+    return pyarrow, pyarrow.parquet
+
+
+class ParquetSnapshotWriter:
+    """Write rows to a compressed Parquet file incrementally, one page at a time.
+
+    Each page becomes a part file in `<path>.partial/`, so memory holds one page
+    at most. Scalar columns keep their types (int, float, bool, string). Nested
+    values such as categories, images, attributes and variants are stored as JSON
+    text and decoded again by `iter_snapshot_rows`, so they round-trip losslessly.
+    `close()` unifies the column types of all parts (ints and floats become
+    float, other conflicts become string) and writes the final file. With
+    `resume_state`, as returned by `state()`, the part files of an interrupted
+    run are kept up to that point.
+    """
+
+    def __init__(self, path, fieldnames=None, compression='zstd', resume_state=None):
+        self.pa, self.pq = import_pyarrow()
+        self.path = path
+        self.partial_path = f"{path}.partial"
+        self.fieldnames = list(fieldnames) if fieldnames else []
+        self.fixed_schema = bool(fieldnames)
+        self.compression = compression
+        self.json_columns = set()
+        self.rows_written = 0
+        self.parts = 0
+        if resume_state:
+            self.fieldnames = resume_state['fieldnames']
+            self.fixed_schema = resume_state['fixed_schema']
+            self.json_columns = set(resume_state['json_columns'])
+            self.rows_written = resume_state['rows_written']
+            self.parts = resume_state['parts']
+            # Drop the parts written after the last checkpoint
+            for part_file in glob.glob(os.path.join(self.partial_path, 'part-*.parquet')):
+                if int(os.path.basename(part_file)[5:-8]) > self.parts:
+                    os.remove(part_file)
+        else:
+            shutil.rmtree(self.partial_path, ignore_errors=True)
+            os.makedirs(self.partial_path)
+
+    def _column(self, name, values):
+        """Build a typed Arrow array for a column, falling back to JSON or string text."""
+        if any(isinstance(value, (list, dict)) for value in values):
+            self.json_columns.add(name)
+            return self.pa.array([None if value is None else json.dumps(value, ensure_ascii=False) for value in values],
+                                 self.pa.string())
+        try:
+            return self.pa.array(values)
+        except (self.pa.ArrowInvalid, self.pa.ArrowTypeError):
+            return self.pa.array([None if value is None else str(value) for value in values], self.pa.string())
+
+    def write_rows(self, rows):
+        """Write a page of row dicts as one part file."""
+        rows = list(rows)
+        if not rows:
+            return
+        names = list(self.fieldnames)
+        if not self.fixed_schema:
+            seen = set(names)
+            for row in rows:
+                for key in row:
+                    if key not in seen:
+                        seen.add(key)
+                        names.append(key)
+            self.fieldnames = names
+        table = self.pa.table({name: self._column(name, [row.get(name) for row in rows]) for name in names})
+        self.parts += 1
+        self.pq.write_table(table, os.path.join(self.partial_path, f"part-{self.parts:06d}.parquet"))
+        self.rows_written += len(rows)
+
+    def state(self):
+        """Return what is needed to resume after the part files written so far."""
+        return {'fieldnames': list(self.fieldnames), 'fixed_schema': self.fixed_schema,
+                'json_columns': sorted(self.json_columns), 'rows_written': self.rows_written, 'parts': self.parts}
+
+    def _unified_schema(self, part_files):
+        """Resolve one type per column across all part files."""
+        pa = self.pa
+        column_types = {name: set() for name in self.fieldnames}
+        for part_file in part_files:
+            for field in self.pq.read_schema(part_file):
+                if not pa.types.is_null(field.type):
+                    column_types[field.name].add(field.type)
+        fields = []
+        for name in self.fieldnames:
+            types = column_types[name]
+            if name in self.json_columns:
+                column_type = pa.string()
+            elif len(types) == 1:
+                column_type = next(iter(types))
+            elif types and all(pa.types.is_integer(t) or pa.types.is_floating(t) for t in types):
+                column_type = pa.float64()
+            else:
+                column_type = pa.string()
+            fields.append(pa.field(name, column_type))
+        return pa.schema(fields, metadata={JSON_COLUMNS_KEY: json.dumps(sorted(self.json_columns)).encode()})
+
+    def close(self):
+        """Combine the part files into the final Parquet file and move it into place."""
+        pa = self.pa
+        part_files = sorted(glob.glob(os.path.join(self.partial_path, 'part-*.parquet')))
+        schema = self._unified_schema(part_files)
+        final_tmp = f"{self.path}.tmp"
+        with self.pq.ParquetWriter(final_tmp, schema, compression=self.compression) as writer:
+            for part_file in part_files:
+                table = self.pq.read_table(part_file)
+                columns = []
+                for field in schema:
+                    if field.name not in table.column_names:
+                        columns.append(pa.nulls(len(table), field.type))
+                    elif field.name in self.json_columns or pa.types.is_string(field.type):
+                        column = table.column(field.name)
+                        columns.append(column if pa.types.is_string(column.type) else column.cast(pa.string()))
+                    else:
+                        columns.append(table.column(field.name).cast(field.type))
+                writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+        os.replace(final_tmp, self.path)
+        shutil.rmtree(self.partial_path)
+        logging.info(f"Wrote {self.rows_written} rows with {len(schema)} columns to {self.path}")
+
+    def abort(self):
+        """Discard the part files, leaving any previous file at `path` untouched."""
+        shutil.rmtree(self.partial_path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+def is_parquet(path):
+    """Tell whether a snapshot path is a Parquet file."""
+    return path.endswith('.parquet')
+
+def open_snapshot_writer(path, fieldnames=None, resume_state=None):
+    """Return a CSV or Parquet snapshot writer, depending on the file extension.
+
+    With `resume_state` from the writer of an interrupted run, its partial output
+    is continued instead of started over.
+    """
+    if is_parquet(path):
+        return ParquetSnapshotWriter(path, fieldnames, resume_state=resume_state)
+    return CsvSnapshotWriter(path, fieldnames, resume_state)
+
+def iter_snapshot_rows(path, columns=None, batch_size=1000):
+    """Yield the rows of a CSV or Parquet snapshot as dicts, keeping only the `columns` that exist when given.
+
+    Parquet snapshots only read the requested columns from disk and decode the
+    nested values stored as JSON.
+    """
+    if not is_parquet(path):
+        with open(path, encoding='utf-8', newline='') as file:
+            for row in csv.DictReader(file):
+                yield {name: row[name] for name in columns if name in row} if columns else row
+        return
+
+    _, pq = import_pyarrow()
+    parquet_file = pq.ParquetFile(path)
+    schema = parquet_file.schema_arrow
+    json_columns = set(json.loads((schema.metadata or {}).get(JSON_COLUMNS_KEY, b'[]')))
+    available = [name for name in columns if name in schema.names] if columns else None
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=available):
+        for row in batch.to_pylist():
+            for name in json_columns.intersection(row):
+                if row[name] is not None:
+                    row[name] = json.loads(row[name])
+            yield row
+
+def convert_snapshot(source, destination):
+    """Convert a snapshot between CSV and Parquet, streaming it in batches."""
+    with open_snapshot_writer(destination) as writer:
+        batch = []
+        for row in iter_snapshot_rows(source):
+            batch.append(row)
+            if len(batch) >= 1000:
+                writer.write_rows(batch)
+                batch = []
+        writer.write_rows(batch)
+    logging.info(f"Converted {source} to {destination}")
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("Usage: python snapshot.py <source.csv|.parquet> <destination.csv|.parquet>")
+        sys.exit(1)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    convert_snapshot(sys.argv[1], sys.argv[2])
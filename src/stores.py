@@ -0,0 +1,158 @@
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from config import STORES_FILE, STORES_DIR, STORE_PARALLELISM, GLOBAL_CONCURRENCY, MIN_CONCURRENCY
+
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+
+# Commands whose --file is a catalog read from the current directory and shared by every store
+SHARED_FILE_COMMANDS = ('upload', 'sync', 'inventory')
+# Of those, the commands whose catalog holds product and term ids, which only mean something in the store it came from
+SHARED_CATALOG_COMMANDS = ('upload', 'sync')
+
+
+def load_stores(path=STORES_FILE):
+    """Read the store profiles: `{name: {url, consumer_key, consumer_secret, env}}`.
+
+    Values may reference environment variables (`${EU_CONSUMER_KEY}`), so keys can
+    stay in `.env`. `env` holds optional per-store settings, e.g. `RATE_LIMIT`.
+    """
+    with open(path, encoding='utf-8') as file:
+        stores = json.load(file)
+    for name, store in stores.items():
+        if not re.fullmatch(r'[A-Za-z0-9_-]+', name):
+            raise ValueError(f"Invalid store name {name!r} in {path}: use letters, digits, - and _")
+        missing = [key for key in ('url', 'consumer_key', 'consumer_secret') if not store.get(key)]
+        if missing:
+            raise ValueError(f"Store {name} in {path} is missing {', '.join(missing)}")
+        for key in ('url', 'consumer_key', 'consumer_secret'):
+            store[key] = os.path.expandvars(store[key])
+        store['env'] = {key: os.path.expandvars(str(value)) for key, value in (store.get('env') or {}).items()}
+    return stores
+
+def select_stores(stores, selection):
+    """Return the names picked by `selection`: `all` or a comma-separated list of names."""
+    if selection == 'all':
+        return list(stores)
+    names = [name.strip() for name in selection.split(',') if name.strip()]
+    unknown = [name for name in names if name not in stores]
+    if unknown:
+        raise ValueError(f"Unknown stores: {', '.join(unknown)} (configured: {', '.join(stores)})")
+    return names
+
+def store_dir(name, stores_dir=STORES_DIR):
+    """Return a store's directory; its `data/` holds the store's snapshots, backups, caches and jobs."""
+    return os.path.abspath(os.path.join(stores_dir, name))
+
+def share_file(path, name, stores_dir=STORES_DIR):
+    """Make a shared catalog file visible in a store's `data/catalog/` and return its path there.
+
+    The file is hard-linked when possible instead of copied, and linked again on
+    every run so edits are picked up. Change-detection hashes are written next to
+    the link, so each store tracks what it was sent.
+    """
+    target_dir = os.path.join(store_dir(name, stores_dir), 'data', 'catalog')
+    os.makedirs(target_dir, exist_ok=True)
+    target = os.path.join(target_dir, os.path.basename(path))
+    if os.path.exists(target):
+        os.remove(target)
+    try:
+        os.link(path, target)
+    except OSError:
+        shutil.copyfile(path, target)
+    return target
+
+def store_argv(argv, command, name, stores_dir=STORES_DIR):
+    """Return the command line to run on one store, with a shared `--file` catalog linked into its directory.
+
+    An upload of a shared catalog also gets `--shared-catalog`, so each store
+    matches products by SKU and terms by slug or name instead of by another store's ids.
+    """
+    argv = list(argv)
+    shared = False
+    if command in SHARED_FILE_COMMANDS:
+        for i, arg in enumerate(argv):
+            if arg == '--file' and i + 1 < len(argv):
+                argv[i + 1] = share_file(os.path.abspath(argv[i + 1]), name, stores_dir)
+                shared = True
+            elif arg.startswith('--file='):
+                argv[i] = f"--file={share_file(os.path.abspath(arg[len('--file='):]), name, stores_dir)}"
+                shared = True
+    if shared and command in SHARED_CATALOG_COMMANDS and '--shared-catalog' not in argv:
+        argv.append('--shared-catalog')
+    return argv
+
+def store_env(store, concurrency):
+    """Return the environment a store's process runs with: its credentials and its share of the request budget."""
+    return {
+        **os.environ,
+        'WOO_URL': store['url'],
+        'CONSUMER_KEY': store['consumer_key'],
+        'CONSUMER_SECRET': store['consumer_secret'],
+        **store['env'],
+        # Set last so a store's own settings cannot take more than its share
+        'MAX_CONCURRENCY': str(concurrency),
+        'MIN_CONCURRENCY': str(min(MIN_CONCURRENCY, concurrency)),
+    }
+
+def run_on_store(name, store, argv, command, concurrency, stores_dir=STORES_DIR):
+    """Run a `main.py` command for one store in its own directory. Returns `(exit code, seconds, log path)`."""
+    directory = store_dir(name, stores_dir)
+    log_dir = os.path.join(directory, 'logs')
+    os.makedirs(log_dir, exist_ok=True)
+    log_path = os.path.join(log_dir, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{command}.log")
+    started = time.perf_counter()
+    try:
+        argv = store_argv(argv, command, name, stores_dir)
+        with open(log_path, 'w', encoding='utf-8') as log:
+            # stdin is closed: a command that would prompt fails instead of waiting for input
+            code = subprocess.run([sys.executable, MAIN_SCRIPT, *argv], cwd=directory, env=store_env(store, concurrency),
+                                  stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT).returncode
+    except OSError as e:
+        logging.error(f"Could not run {command} on store {name}: {e}")
+        code = 1
+    return code, time.perf_counter() - started, log_path
+
+def fan_out(argv, command, selection='all', parallel=STORE_PARALLELISM, budget=GLOBAL_CONCURRENCY, stores_file=STORES_FILE,
+            stores_dir=STORES_DIR):
+    """Run a `main.py` command line on several stores at once. Returns True when it succeeded on every store.
+
+    At most `parallel` stores run at a time, each in its own process and
+    directory, so their data never mixes. The `budget` of requests in flight is
+    split evenly between them through each store's MAX_CONCURRENCY.
+    """
+    stores = load_stores(stores_file)
+    names = select_stores(stores, selection)
+    if not names:
+        logging.error(f"No stores configured in {stores_file}")
+        return False
+    parallel = max(1, min(parallel, len(names)))
+    concurrency = max(1, budget // parallel)
+    logging.info(f"Running {command} on {len(names)} stores, {parallel} at a time, "
+                 f"up to {concurrency} requests in flight each")
+
+    def run(name):
+        logging.info(f"{name}: started")
+        code, seconds, log_path = run_on_store(name, stores[name], argv, command, concurrency, stores_dir)
+        log = logging.info if code == 0 else logging.error
+        log(f"{name}: {'ok' if code == 0 else 'failed'} in {seconds:.1f}s, log: {log_path}")
+        return name, code, seconds, log_path
+
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        results = list(executor.map(run, names))
+    print(f"\n{'store':<20} {'status':<8} {'seconds':>8}  log")
+    for name, code, seconds, log_path in results:
+        print(f"{name:<20} {'ok' if code == 0 else 'failed':<8} {seconds:8.1f}  {log_path}")
+    return all(code == 0 for _, code, _, _ in results)
+
+def print_stores(stores_file=STORES_FILE, stores_dir=STORES_DIR):
+    """Print the configured stores and their directories."""
+    for name, store in load_stores(stores_file).items():
+        print(f"{name:<20} {store['url']:<40} {store_dir(name, stores_dir)}")
@@ -0,0 +1,121 @@
+import json
+import logging
+import os
+import threading
+import time
+from client import fetch_all_pages
+from config import TERM_CACHE_TTL, TERM_CACHE_MAX_AGE
+
+TERM_ENDPOINTS = {
+    'categories': 'products/categories',
+    'tags': 'products/tags',
+}
+
+_lock = threading.Lock()
+_indexes = {}
+
+
+def term_index_path(taxonomy, cache_dir='data/cache'):
+    """Return the path of the on-disk index cache for a taxonomy."""
+    return os.path.join(cache_dir, f"{taxonomy}_index.json")
+
+def fetch_terms(api, taxonomy, fields=None, strict=False):
+    """Fetch every term of a taxonomy, 100 per page with the pages fetched in parallel."""
+    params = {"_fields": fields} if fields else None
+    return fetch_all_pages(api, TERM_ENDPOINTS[taxonomy], params, strict=strict)
+
+def get_fingerprint(api, taxonomy):
+    """Return a cheap fingerprint of a taxonomy: term count, newest term id and ETag.
+
+    It costs one request for a single term id, and changes when terms are added
+    or deleted, but not when they are renamed.
+    """
+    response = api.get(TERM_ENDPOINTS[taxonomy], params={"per_page": 1, "orderby": "id", "order": "desc", "_fields": "id"})
+    response.raise_for_status()
+    newest = response.json()
+    return {
+        'total': response.headers.get('X-WP-Total'),
+        'newest_id': newest[0]['id'] if newest else None,
+        'etag': response.headers.get('ETag'),
+    }
+
+def save_term_index(taxonomy, terms, fingerprint=None, cache_dir='data/cache', fetched_at=None):
+    """Cache the id, slug and name of every term of a taxonomy on disk and in memory.
+
+    `fetched_at` is when the terms were crawled, if not just now; `checked_at` is
+    when they were last found current.
+    """
+    now = time.time()
+    index = {
+        'fetched_at': fetched_at or now,
+        'checked_at': now,
+        'fingerprint': fingerprint,
+        'terms': [{'id': term['id'], 'slug': term['slug'], 'name': term['name']} for term in terms],
+    }
+    path = term_index_path(taxonomy, cache_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as file:
+        json.dump(index, file)
+    os.replace(f"{path}.tmp", path)
+    with _lock:
+        _indexes[(taxonomy, cache_dir)] = index
+    logging.info(f"Cached {len(index['terms'])} {taxonomy} in {path}")
+    return index
+
+def invalidate_term_index(taxonomy, cache_dir='data/cache'):
+    """Drop the cached index of a taxonomy, e.g. after uploading terms."""
+    with _lock:
+        _indexes.pop((taxonomy, cache_dir), None)
+    try:
+        os.remove(term_index_path(taxonomy, cache_dir))
+    except FileNotFoundError:
+        pass
+
+def _load_cached_index(taxonomy, cache_dir):
+    """Return the cached index of a taxonomy from memory or disk, or None."""
+    with _lock:
+        index = _indexes.get((taxonomy, cache_dir))
+    if index is not None:
+        return index
+    try:
+        with open(term_index_path(taxonomy, cache_dir), encoding='utf-8') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logging.error(f"Error reading cached {taxonomy} index: {e}")
+        return None
+
+def load_term_index(api, taxonomy, refresh=False, cache_dir='data/cache'):
+    """Return the cached index of a taxonomy, crawling it again only when it is stale.
+
+    A cache checked less than TERM_CACHE_TTL ago is used without any request. An
+    older one is revalidated with a one-term request and reused if the term count,
+    newest term id and ETag have not changed. Otherwise, or once the cache is
+    TERM_CACHE_MAX_AGE old, every term is fetched again.
+    """
+    index = None if refresh else _load_cached_index(taxonomy, cache_dir)
+    if index is not None and time.time() - index['fetched_at'] >= TERM_CACHE_MAX_AGE:
+        logging.info(f"Cached {taxonomy} index is older than {TERM_CACHE_MAX_AGE}s.")
+        index = None
+    if index is not None:
+        if time.time() - index.get('checked_at', index['fetched_at']) < TERM_CACHE_TTL:
+            return index
+        try:
+            fingerprint = get_fingerprint(api, taxonomy)
+        except Exception as e:
+            logging.error(f"Failed to revalidate the cached {taxonomy} index: {e}")
+            fingerprint = None
+        if fingerprint is not None and fingerprint == index.get('fingerprint'):
+            logging.info(f"Cached {taxonomy} index is still current.")
+            return save_term_index(taxonomy, index['terms'], fingerprint, cache_dir, index['fetched_at'])
+
+    logging.info(f"Fetching the {taxonomy} index from WooCommerce...")
+    fingerprint = get_fingerprint(api, taxonomy)
+    terms = fetch_terms(api, taxonomy, fields="id,slug,name", strict=True)
+    return save_term_index(taxonomy, terms, fingerprint, cache_dir)
+
+def get_term_index(api, taxonomy, by='slug', refresh=False, cache_dir='data/cache'):
+    """Return a `by` (slug or name) to term id mapping for a taxonomy."""
+    index = load_term_index(api, taxonomy, refresh, cache_dir)
+    return {term[by]: term['id'] for term in index['terms']}
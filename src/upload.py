@@ -1,54 +1,161 @@
+import argparse
+import ast
+import html
+import itertools
 import logging
-import pandas as pd
 import csv
-from woocommerce import API
-from config import WOO_URL, CONSUMER_KEY, CONSUMER_SECRET
+import random
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from client import get_wc_api, fetch_all_pages
+from diff import iter_payload_changes, hash_index_path, load_hash_index, payload_hash, save_hash_index
+from jobs import start_job
+from metrics import add_rows, report_run, timer
+from scheduler import SAFE_RETRY_STATUSES, never_sent
+from snapshot import iter_snapshot_rows
+from terms import TERM_ENDPOINTS, get_term_index, invalidate_term_index
+from config import (BATCH_SIZE, BATCH_MAX_RETRIES, UPLOAD_CONCURRENCY, PRODUCTS_FILE, LOG_PAYLOADS,
+                    PAYLOAD_LOG_SAMPLE, METRICS_REPORT)
 
 # Logging configuration
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def get_wc_api(timeout=50):
-    """Create and return a WooCommerce API client instance with a specified timeout."""
-    return API(
-        url=WOO_URL,
-        consumer_key=CONSUMER_KEY,
-        consumer_secret=CONSUMER_SECRET,
-        version="wc/v3",
-        timeout=timeout
-    )
-
-def read_data_from_csv(filename):
-    """Read data from a CSV file."""
-    data = []
+# Product columns sent to the API
+PRODUCT_COLUMNS = [
+    'name', 'type', 'status', 'sku', 'price', 'regular_price',
+    'sale_price', 'description', 'short_description', 'categories', 'tags'
+]
+
+# Batch item errors that will fail again however often they are retried
+NON_RETRYABLE_ERRORS = {
+    'product_invalid_sku', 'term_exists', 'rest_invalid_param',
+    'woocommerce_rest_product_invalid_id', 'woocommerce_rest_term_invalid',
+}
+
+def log_payload(message, payload):
+    """Log a request payload at debug level, only when LOG_PAYLOADS is set and for a PAYLOAD_LOG_SAMPLE fraction of calls.
+
+    Formatting every payload into the log costs more than the upload itself on
+    large catalogs, so payloads are left out of the log by default.
+    """
+    if LOG_PAYLOADS and random.random() < PAYLOAD_LOG_SAMPLE:
+        logging.debug(f"{message}: {payload}")
+
+def iter_data_from_csv(filename):
+    """Yield the rows of a CSV file one at a time, without loading the whole file."""
+    count = 0
     try:
-        with open(filename, mode='r', encoding='utf-8') as file:
-            csv_reader = csv.DictReader(file)
-            for row in csv_reader:
-                data.append(row)
-        logging.info(f"Successfully read {len(data)} records from {filename}")
+        with open(filename, mode='r', encoding='utf-8', newline='') as file:
+            for row in csv.DictReader(file):
+                count += 1
+                yield row
+        logging.info(f"Successfully read {count} records from {filename}")
     except Exception as e:
         logging.error(f"Error reading data from CSV: {e}")
-    return data
+
+def parse_terms(value, keep_ids=True):
+    """Turn a categories or tags value into API term references.
+
+    Accepts the nested list read from a Parquet snapshot, its Python repr as
+    written to CSV by an extract, or a bracketed, comma separated list of names.
+    Terms with an id are referenced by id, the rest by name. Without `keep_ids`,
+    for a catalog extracted from another store, ids are dropped and terms are
+    referenced by slug and name, to be resolved against this store's terms.
+    """
+    if isinstance(value, str) and value.lstrip().startswith('[{'):
+        try:
+            value = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            pass
+    if isinstance(value, list):
+        return [term_reference(term, keep_ids) for term in value]
+    return [{'name': name.strip()} for name in value.strip('[]').split(',') if name.strip()] if value else []
+
+def term_reference(term, keep_ids=True):
+    """Return the API reference of one parsed term: its id, or else its name (and slug without `keep_ids`)."""
+    if not isinstance(term, dict):
+        return {'name': str(term)}
+    if keep_ids and term.get('id'):
+        return {'id': term['id']}
+    if not keep_ids and term.get('slug'):
+        return {'slug': term['slug'], 'name': term.get('name')}
+    return {'name': term.get('name')}
+
+def is_missing(value):
+    """Tell whether a value is empty the way pandas sees it: None or a float NaN."""
+    return value is None or (isinstance(value, float) and value != value)
 
 def format_product_data(product):
     """Format product data to match WooCommerce API requirements."""
     formatted_data = {}
-    columns_to_include = [
-        'name', 'type', 'status', 'sku', 'price', 'regular_price', 
-        'sale_price', 'description', 'short_description', 'categories', 'tags'
-    ]
-    
     for key, value in product.items():
-        if key in columns_to_include:
-            if pd.isna(value):
+        if key in PRODUCT_COLUMNS:
+            if isinstance(value, list):
+                formatted_data[key] = parse_terms(value)
+            elif is_missing(value):
                 formatted_data[key] = None
             elif key in ['categories', 'tags']:
-                formatted_data[key] = [{'name': name.strip()} for name in value.strip('[]').split(',')] if value else []
+                formatted_data[key] = parse_terms(value)
             else:
                 formatted_data[key] = value
 
     return formatted_data
 
+def resolve_terms(terms, ids_by_name, ids_by_slug=None):
+    """Reference terms by id instead of by slug or name wherever the slug or (unescaped) name is known."""
+    resolved = []
+    for term in terms:
+        term_id = (ids_by_slug or {}).get(term.get('slug'))
+        if not term_id and term.get('name'):
+            term_id = ids_by_name.get(html.unescape(term['name']))
+        resolved.append({'id': term_id} if term_id else term)
+    return resolved
+
+def resolve_product_terms(payload, term_ids, term_slugs=None):
+    """Return a product payload with its categories and tags given by name (or slug) sent by id.
+
+    `term_ids` is a `{'categories': {name: id}, 'tags': {name: id}}` mapping and
+    `term_slugs` the same by slug, so the server does not have to look terms up.
+    """
+    term_slugs = term_slugs or {}
+    resolved = {column: resolve_terms(payload[column], term_ids.get(column) or {}, term_slugs.get(column))
+                for column in ('categories', 'tags')
+                if payload.get(column) and (term_ids.get(column) or term_slugs.get(column))}
+    return {**payload, **resolved} if resolved else payload
+
+def format_product_frame(frame, keep_ids=True):
+    """Format a DataFrame (or a chunk of one) of products into API payloads, column by column.
+
+    Gives the same payloads as `format_product_data` on every row, but projects
+    the API columns once, normalizes nulls for the whole frame and parses each
+    distinct categories or tags value only once. `keep_ids` is passed to `parse_terms`.
+    """
+    frame = frame[[column for column in frame.columns if column in PRODUCT_COLUMNS]].astype(object)
+    frame = frame.where(frame.notna(), None)
+    for column in ('categories', 'tags'):
+        if column not in frame:
+            continue
+        parsed = {}
+
+        def parse(value):
+            if value is None:
+                return None
+            if not isinstance(value, str):
+                return parse_terms(value, keep_ids)
+            if value not in parsed:
+                parsed[value] = parse_terms(value, keep_ids)
+            return parsed[value]
+
+        frame[column] = frame[column].map(parse)
+    return frame.to_dict('records')
+
+def iter_formatted_products(rows, chunk_size=1000, keep_ids=True):
+    """Yield `(row, payload)` for product rows, formatting them a chunk at a time with `format_product_frame`."""
+    import pandas as pd
+    for chunk in chunked(rows, chunk_size):
+        # dtype=object keeps the values as read instead of inferring numeric columns
+        with timer('formatting'):
+            payloads = format_product_frame(pd.DataFrame(chunk, dtype=object), keep_ids)
+        yield from zip(chunk, payloads)
 
 def format_category_data(category):
     """Format category data to match WooCommerce API requirements."""
@@ -68,143 +175,342 @@ def format_tag_data(tag):
     }
     return formatted_data
 
-def get_existing_tags(api):
-    """Retrieve existing tags from WooCommerce."""
-    existing_tags = {}
-    try:
-        response = api.get("products/tags", params={"per_page": 100})
-        response.raise_for_status()
-        tags = response.json()
-        for tag in tags:
-            existing_tags[tag['slug']] = tag['id']
-        logging.info(f"Retrieved {len(existing_tags)} existing tags from WooCommerce")
-    except Exception as e:
-        logging.error(f"Failed to retrieve existing tags: {e}")
-    return existing_tags
-
 def get_existing_items(api, endpoint):
-    """Retrieve existing tags or categories from WooCommerce."""
+    """Retrieve existing tags or categories from WooCommerce, from the cached term index when it is current."""
     existing_items = {}
+    taxonomy = next(name for name, path in TERM_ENDPOINTS.items() if path == endpoint)
     try:
-        response = api.get(endpoint, params={"per_page": 100})
-        response.raise_for_status()
-        items = response.json()
-        for item in items:
-            existing_items[item['slug']] = item['id']
+        existing_items = get_term_index(api, taxonomy)
         logging.info(f"Retrieved {len(existing_items)} existing items from {endpoint}")
     except Exception as e:
         logging.error(f"Failed to retrieve existing items from {endpoint}: {e}")
     return existing_items
 
+def get_term_ids(api, by='name'):
+    """Return `{'categories': {name: id}, 'tags': {name: id}}` from the term indexes, with names HTML-unescaped.
+
+    With `by='slug'`, the mappings are by slug instead.
+    """
+    term_ids = {}
+    for taxonomy in TERM_ENDPOINTS:
+        try:
+            index = get_term_index(api, taxonomy, by=by)
+            term_ids[taxonomy] = {html.unescape(key) if by == 'name' else key: term_id for key, term_id in index.items()}
+        except Exception as e:
+            logging.error(f"Failed to load the {taxonomy} index, {taxonomy} given by {by} are sent by {by}: {e}")
+    return term_ids
+
+def get_existing_skus(api):
+    """Build a SKU to product id index of every product in WooCommerce, and the set of their ids.
+
+    Only `id` and `sku` are requested, 100 products per page, with the pages
+    fetched in parallel, so the index costs one small request per 100 products.
+    Returns `(skus, ids)`, or None if the index could not be built completely.
+    """
+    existing_skus = {}
+    existing_ids = set()
+    try:
+        products = fetch_all_pages(api, "products", params={"_fields": "id,sku"}, strict=True)
+        for product in products:
+            existing_ids.add(product['id'])
+            if product.get('sku'):
+                existing_skus[product['sku']] = product['id']
+        logging.info(f"Retrieved {len(existing_skus)} existing SKUs from WooCommerce")
+    except Exception as e:
+        logging.error(f"Failed to retrieve existing SKUs: {e}")
+        return None
+    return existing_skus, existing_ids
+
+def row_product_id(row, existing_ids):
+    """Return the id a product row was extracted with, if that product still exists in the store."""
+    try:
+        product_id = int(float(row.get('id')))
+    except (TypeError, ValueError):
+        return None
+    return product_id if product_id in existing_ids else None
+
+def chunked(items, size):
+    """Yield successive lists of at most `size` items."""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def send_batch(api, endpoint, operations):
+    """Send (row, action, payload, item) operations in one batch request and return (operation, result) pairs."""
+    buckets = {'create': [], 'update': [], 'delete': []}
+    for operation in operations:
+        buckets[operation[1]].append(operation)
+    payload = {action: [op[2] for op in ops] for action, ops in buckets.items() if ops}
+    log_payload(f"Batch request to {endpoint}/batch", payload)
+    response = api.post(f"{endpoint}/batch", data=payload)
+    response.raise_for_status()
+    body = response.json()
+    results = []
+    for action, ops in buckets.items():
+        items = body.get(action) or []
+        for index, op in enumerate(ops):
+            result = items[index] if index < len(items) else {'error': {'code': 'missing_result', 'message': 'No result returned for this item'}}
+            results.append((op, result))
+    return results
+
+def upload_batch(api, endpoint, operations, max_retries=BATCH_MAX_RETRIES):
+    """Send one chunk of operations, retrying only the items that failed.
 
-def update_data_in_woocommerce(api, data, endpoint, format_func):
-    """Update data in WooCommerce."""
-    for item in data:
-        formatted_data = format_func(item)
+    A batch that failed as a whole is only sent again in full when the store
+    cannot have processed it (429, 503 or no connection); otherwise its creates
+    count as failed. Returns a summary with per-action counts, the operations
+    that succeeded and the CSV row numbers that still failed after all retries.
+    """
+    summary = {'created': 0, 'updated': 0, 'deleted': 0, 'succeeded': [], 'failed': []}
+    pending = operations
+    attempt = 0
+    while pending:
+        failed = []
         try:
-            logging.debug(f"Uploading data: {formatted_data}")
-            response = api.post(endpoint, data=formatted_data)
-            response.raise_for_status()
-            logging.info(f"Data uploaded successfully to {endpoint}: {formatted_data}")
+            results = send_batch(api, endpoint, pending)
         except Exception as e:
-            logging.error(f"Failed to upload data to {endpoint}: {e}")
-            logging.debug(f"Request data: {formatted_data}")
+            logging.error(f"Batch request to {endpoint}/batch failed for {len(pending)} items: {e}")
             if hasattr(e, 'response') and e.response is not None:
                 logging.debug(f"Response content: {e.response.content}")
-
-def update_data_tag_in_woocommerce(api, data, endpoint, format_func, existing_items):
-    """Update data in WooCommerce."""
-    for item in data:
-        formatted_data = format_func(item)
-        slug = formatted_data.get('slug')
-        if slug in existing_items:
-            tag_id = existing_items[slug]
-            try:
-                logging.debug(f"Updating tag with ID {tag_id}")
-                response = api.put(f"{endpoint}/{tag_id}", data=formatted_data)
-                response.raise_for_status()
-                logging.info(f"Tag updated successfully.")
-            except Exception as e:
-                logging.error(f"Failed to update tag with ID {tag_id}: {e}")
-                if hasattr(e, 'response') and e.response is not None:
-                    logging.debug(f"Response content: {e.response.content}")
+            status = e.response.status_code if getattr(e, 'response', None) is not None else None
+            if status in SAFE_RETRY_STATUSES or never_sent(e):
+                failed = [(op, True) for op in pending]
+            else:
+                # The store may have applied the batch: sending a create again would duplicate it, so creates are left
+                # for the next run, which finds them in the SKU index; updates and deletes are safe to repeat
+                failed = [(op, op[1] != 'create') for op in pending]
+                created = sum(1 for op in pending if op[1] == 'create')
+                if created:
+                    logging.warning(f"{created} creates in {endpoint} may have been applied and are not retried")
         else:
-            try:
-                logging.debug(f"Creating new tag: {formatted_data}")
-                response = api.post(endpoint, data=formatted_data)
-                response.raise_for_status()
-                logging.info(f"Tag created successfully.")
-            except Exception as e:
-                logging.error(f"Failed to create new tag: {e}")
-                if hasattr(e, 'response') and e.response is not None:
-                    logging.debug(f"Response content: {e.response.content}")
-
-def update_data_categories_in_woocommerce(api, data, endpoint, format_func, existing_items):
-    """Update data in WooCommerce."""
-    for item in data:
-        formatted_data = format_func(item)
-        slug = formatted_data.get('slug')
-        if slug in existing_items:
-            item_id = existing_items[slug]
-            try:
-                logging.debug(f"Updating item with ID {item_id}.")
-                response = api.put(f"{endpoint}/{item_id}", data=formatted_data)
-                response.raise_for_status()
-                logging.info(f"Item updated successfully.")
-            except Exception as e:
-                logging.error(f"Failed to update item with ID {item_id}: {e}")
-                logging.debug(f"Request data: {formatted_data}")
-                if hasattr(e, 'response') and e.response is not None:
-                    logging.debug(f"Response content: {e.response.content}")
+            for operation, result in results:
+                row, action = operation[0], operation[1]
+                error = result.get('error') if isinstance(result, dict) else None
+                if error:
+                    label = f"row {row}" if row is not None else f"ID {operation[2]}"
+                    logging.error(f"Failed to {action} {label} in {endpoint}: {error.get('code')} - {error.get('message')}")
+                    failed.append((operation, error.get('code') not in NON_RETRYABLE_ERRORS))
+                else:
+                    summary[f"{action}d"] += 1
+                    summary['succeeded'].append(operation)
+        retryable = [op for op, can_retry in failed if can_retry]
+        summary['failed'].extend(op[0] for op, can_retry in failed if not can_retry)
+        if retryable and attempt < max_retries:
+            attempt += 1
+            logging.info(f"Retrying {len(retryable)} failed items in {endpoint} (attempt {attempt} of {max_retries})")
+            pending = retryable
+        else:
+            summary['failed'].extend(op[0] for op in retryable)
+            pending = []
+    return summary
+
+def run_bounded(func, items, concurrency=UPLOAD_CONCURRENCY):
+    """Yield `func(item)` for each item, with at most `concurrency` calls in flight.
+
+    Items are pulled from the iterable only when a worker is free, so a lazy
+    pipeline upstream never holds more than `concurrency` items in memory.
+    Results are yielded in completion order.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        in_flight = set()
+        for item in items:
+            if len(in_flight) >= concurrency:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            in_flight.add(executor.submit(func, item))
+        for future in in_flight:
+            yield future.result()
+
+def batch_update_in_woocommerce(api, data, endpoint, format_func, existing_items=None, delete_ids=None,
+                                chunk_size=BATCH_SIZE, max_retries=BATCH_MAX_RETRIES, key='slug',
+                                concurrency=UPLOAD_CONCURRENCY, on_success=None, row_of=None):
+    """Upload data through the `<endpoint>/batch` route, retrying only the rows that failed.
+
+    Rows whose `key` field (slug by default) is in `existing_items` are updated,
+    the rest are created, and `delete_ids` are deleted. `data` may be any iterable
+    and is consumed lazily: rows are formatted and grouped into batches only as
+    fast as `concurrency` batch requests complete. `on_success(item)` is called
+    for every row that was uploaded. Returns a summary with per-action counts and
+    the CSV row numbers (1-based, header excluded) that still failed; `row_of(item)`
+    gives an item's row number when `data` is not the whole file.
+    """
+    existing_items = existing_items or {}
+
+    def operations():
+        for row, item in enumerate(data, 1):
+            row = row_of(item) if row_of else row
+            formatted_data = format_func(item)
+            item_id = formatted_data.get('id') or existing_items.get(formatted_data.get(key))
+            if item_id:
+                yield (row, 'update', {**formatted_data, 'id': item_id}, item)
+            else:
+                yield (row, 'create', formatted_data, item)
+        for item_id in delete_ids or []:
+            yield (None, 'delete', item_id, None)
+
+    summary = {'created': 0, 'updated': 0, 'deleted': 0, 'failed': []}
+    batches = chunked(operations(), chunk_size)
+    for result in run_bounded(lambda batch: upload_batch(api, endpoint, batch, max_retries), batches, concurrency):
+        for action in ('created', 'updated', 'deleted'):
+            summary[action] += result[action]
+        add_rows('uploaded', result['created'] + result['updated'] + result['deleted'])
+        summary['failed'].extend(row for row in result['failed'] if row is not None)
+        if on_success:
+            for operation in result['succeeded']:
+                if operation[0] is not None:
+                    on_success(operation[3])
+
+    summary['failed'].sort()
+    logging.info(f"Batch upload to {endpoint} finished: {summary['created']} created, {summary['updated']} updated, "
+                 f"{summary['deleted']} deleted, {len(summary['failed'])} failed")
+    if summary['failed']:
+        logging.warning(f"Rows that could not be uploaded to {endpoint}: {summary['failed']}")
+    return summary
+
+class UploadJournal:
+    """Record the rows of an upload in the job journal as their batches succeed.
+
+    Rows are identified by key and payload hash; `done` holds the rows completed
+    by an interrupted run of the same upload, which a resumed run skips as long as
+    their payload has not changed since.
+    """
+
+    def __init__(self, filename, params=None, restart=False):
+        self.job = start_job('upload', filename, params, restart)
+        self.done = self.job.items() if self.job.resumed else {}
+        self.pending = []
+
+    def record(self, key, digest):
+        """Mark a row uploaded, writing to the journal once a batch worth of rows is pending."""
+        self.pending.append((key, digest))
+        if len(self.pending) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Write the pending rows to the journal."""
+        if self.pending:
+            self.job.checkpoint(self.pending)
+            self.pending = []
+
+    def finish(self, summary):
+        """Close the job: completed when every row was uploaded, partial otherwise."""
+        self.flush()
+        if summary is None or summary['failed']:
+            failed = len(summary['failed']) if summary else 'all'
+            self.job.finish('partial', f"{failed} rows failed, run the upload again to retry them")
         else:
-            try:
-                logging.debug(f"Creating new item: {formatted_data}")
-                response = api.post(endpoint, data=formatted_data)
-                response.raise_for_status()
-                logging.info(f"Item created successfully: {formatted_data}")
-            except Exception as e:
-                logging.error(f"Failed to create new item: {e}")
-                logging.debug(f"Request data: {formatted_data}")
-                if hasattr(e, 'response') and e.response is not None:
-                    logging.debug(f"Response content: {e.response.content}")
-
-def upload_products():
-    """Upload products to WooCommerce."""
-    products = read_data_from_csv('data/products.csv')
-    if products:
+            self.job.finish('completed')
+
+def upload_products(filename=PRODUCTS_FILE, force=False, restart=False, shared=False):
+    """Upsert the product rows that changed since the last extract or upload. Returns the summary, or None if aborted."""
+    journal = UploadJournal(filename, {'force': force}, restart)
+    index_path = hash_index_path(filename)
+    index = {} if force else load_hash_index(index_path)
+    if journal.done:
+        # Rows uploaded by the interrupted run are unchanged unless they were edited since
+        logging.info(f"Resuming the upload of {filename}: {len(journal.done)} rows were already uploaded")
+        index.update(journal.done)
+    counts = {'new': 0, 'changed': 0, 'unchanged': 0}
+    rows = iter_snapshot_rows(filename, columns=['id'] + PRODUCT_COLUMNS)
+    # The ids in a catalog shared between stores belong to the store it was extracted from
+    changes = iter_payload_changes(iter_formatted_products(rows, keep_ids=not shared), index, counts)
+    first = next(changes, None)
+    if first is None:
+        # Nothing to send, so the store's SKU and term indexes are not needed
+        summary = {'created': 0, 'updated': 0, 'deleted': 0, 'failed': []}
+    else:
         wc_api = get_wc_api()
-        update_data_in_woocommerce(wc_api, products, 'products', format_product_data)
+        existing = get_existing_skus(wc_api)
+        if existing is None:
+            # Without a complete index every existing product would be created again
+            logging.error("Product upload aborted: the SKU index could not be built.")
+            journal.finish(None)
+            return None
+        existing_skus, existing_ids = existing
+        term_ids = get_term_ids(wc_api)
+        term_slugs = get_term_ids(wc_api, by='slug') if shared else None
+
+        def payload_of(change):
+            payload, row = resolve_product_terms(change[2], term_ids, term_slugs), change[4]
+            # A row without a SKU updates the product it was extracted from instead of creating a copy
+            product_id = None if payload.get('sku') or shared else row_product_id(row, existing_ids)
+            return {**payload, 'id': product_id} if product_id else payload
+
+        def record_upload(change):
+            index[change[0]] = change[1]
+            journal.record(change[0], change[1])
+
+        summary = batch_update_in_woocommerce(wc_api, itertools.chain([first], changes), 'products', payload_of,
+                                              existing_skus, key='sku', on_success=record_upload,
+                                              row_of=lambda change: change[3])
+    logging.info(f"Products: {counts['new']} new, {counts['changed']} changed, {counts['unchanged']} unchanged")
+    if counts['new'] or counts['changed'] or journal.done:
+        save_hash_index(index, index_path)
+    journal.finish(summary)
+    logging.info(f"Products: {summary['created']} created, {summary['updated']} updated, "
+                 f"{counts['unchanged']} unchanged, {len(summary['failed'])} failed")
+    return summary
+
+def upload_terms(taxonomy, format_func, filename, restart=False):
+    """Upload categories or tags to WooCommerce, resuming an interrupted upload of the same file."""
+    journal = UploadJournal(filename, restart=restart)
 
-def upload_categories():
+    def remaining(rows):
+        for row_number, row in rows:
+            payload = format_func(row)
+            if journal.done.get(payload['slug']) != payload_hash(payload):
+                yield row_number, row
+
+    # Rows travel with their CSV row number, so failures are reported by it even when resumed rows are skipped
+    rows = enumerate(iter_data_from_csv(filename), 1)
+    if journal.done:
+        logging.info(f"Resuming the upload of {filename}: {len(journal.done)} rows were already uploaded")
+        rows = remaining(rows)
+    wc_api = get_wc_api()
+    existing_items = get_existing_items(wc_api, TERM_ENDPOINTS[taxonomy])
+
+    def record_upload(item):
+        payload = format_func(item[1])
+        journal.record(payload['slug'], payload_hash(payload))
+
+    summary = batch_update_in_woocommerce(wc_api, rows, TERM_ENDPOINTS[taxonomy], lambda item: format_func(item[1]),
+                                          existing_items, on_success=record_upload, row_of=lambda item: item[0])
+    invalidate_term_index(taxonomy)
+    journal.finish(summary)
+    return summary
+
+def upload_categories(filename='data/categories.csv', restart=False):
     """Upload categories to WooCommerce."""
-    categories = read_data_from_csv('data/categories.csv')
-    if categories:
-        wc_api = get_wc_api()
-        existing_categories = get_existing_items(wc_api, 'products/categories')
-        update_data_categories_in_woocommerce(wc_api, categories, 'products/categories', format_category_data, existing_categories)
+    return upload_terms('categories', format_category_data, filename, restart)
 
 
-def upload_tags():
+def upload_tags(filename='data/tags.csv', restart=False):
     """Upload tags to WooCommerce."""
-    tags = read_data_from_csv('data/tags.csv')
-    if tags:
-        wc_api = get_wc_api()
-        existing_tags = get_existing_tags(wc_api)
-        update_data_tag_in_woocommerce(wc_api, tags, 'products/tags', format_tag_data, existing_tags)
+    return upload_terms('tags', format_tag_data, filename, restart)
 
 if __name__ == '__main__':
-    import sys
-    if len(sys.argv) != 2:
-        print("Usage: python upload.py [products|categories|tags]")
-        sys.exit(1)
-
-    option = sys.argv[1]
-    if option == 'products':
-        upload_products()
-    elif option == 'categories':
-        upload_categories()
-    elif option == 'tags':
-        upload_tags()
-    else:
-        print("Invalid option. Use 'products', 'categories', or 'tags'.")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Upload data from the data/ directory to WooCommerce.")
+    parser.add_argument('option', choices=['products', 'categories', 'tags'])
+    parser.add_argument('--force', action='store_true',
+                        help="upload every product row, even the ones unchanged since the last extract or upload")
+    parser.add_argument('--file', default=PRODUCTS_FILE, help="product snapshot to upload, CSV or Parquet")
+    parser.add_argument('--restart', action='store_true', help="start over instead of resuming an interrupted upload")
+    parser.add_argument('--shared-catalog', action='store_true',
+                        help="the file was extracted from another store: ignore its ids and match terms by slug or name")
+    parser.add_argument('--metrics-report', default=METRICS_REPORT,
+                        help="also write the run metrics to this file: Prometheus text for .prom, JSON otherwise")
+    args = parser.parse_args()
+
+    if args.option == 'products':
+        upload_products(args.file, force=args.force, restart=args.restart, shared=args.shared_catalog)
+    elif args.option == 'categories':
+        upload_categories(restart=args.restart)
+    elif args.option == 'tags':
+        upload_tags(restart=args.restart)
+    report_run(args.metrics_report)